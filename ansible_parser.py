@@ -1,14 +1,33 @@
 """Ansible Parser Module - Funktionen zum Parsen von Ansible-Dateien."""
 
-import glob
 import os
 import re
 import yaml
 import logging
+from collections import deque
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import IO
+
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # PyYAML ohne libyaml
+    from yaml import SafeLoader as _YamlLoader
 
 logger = logging.getLogger(__name__)
 
+# Verzeichnisse, die beim Repo-Index nie betreten werden (zusätzlich zu .*)
+_SKIP_DIRS = {"__pycache__", "node_modules"}
+
+_INVENTORY_DIRS = {"inventory", "inventories"}
+_VARS_DIRS = {"group_vars", "host_vars"}
+_NO_PLAYBOOK_DIRS = {"inventory", "inventories", "roles"}
+_HOSTS_FILES = {"hosts", "hosts.yml", "hosts.yaml", "hosts.ini"}
+
+_INI_SECTION_RE = re.compile(rb'^\[([^:\]]+)(?::(\w+))?\]$')
+
 
 @dataclass
 class AnsibleData:
@@ -20,104 +39,273 @@ class AnsibleData:
     role_dependencies: dict[str, list[str]] = field(default_factory=dict)
 
 
-def find_role_tasks(repo_path: str, role_name: str) -> list[dict]:
-    """Sucht die Tasks einer Rolle im roles/ Verzeichnis."""
-    role_paths = [
-        f"{repo_path}/**/roles/{role_name}/tasks/main.yml",
-        f"{repo_path}/**/roles/{role_name}/tasks/main.yaml",
-    ]
-    for pattern in role_paths:
-        for role_file in glob.glob(pattern, recursive=True):
-            try:
-                with open(role_file, encoding="utf-8") as f:
-                    tasks = yaml.safe_load(f)
-                    if tasks and isinstance(tasks, list):
-                        return tasks
-            except (yaml.YAMLError, IOError) as e:
-                logger.warning(f"Konnte Role nicht laden: {role_file} - {e}")
+@dataclass
+class RepoIndex:
+    """Ergebnis eines einzelnen Dateisystem-Durchlaufs über ein Repository."""
+    inventories: list[str] = field(default_factory=list)
+    playbook_candidates: list[str] = field(default_factory=list)
+    roles: dict[str, str] = field(default_factory=dict)
+
+
+def _yload(stream: IO[bytes]) -> object:
+    """Parst YAML mit dem schnellsten verfügbaren Safe-Loader (libyaml)."""
+    return yaml.load(stream, Loader=_YamlLoader)
+
+
+@lru_cache(maxsize=4096)
+def _load_yaml_cached(path: str, mtime_ns: int, size: int) -> object:
+    """Parst eine YAML-Datei; der Cache-Key enthält mtime und Größe."""
+    with open(path, "rb") as f:
+        return _yload(f)
+
+
+def _load_yaml(path: str) -> object:
+    """Lädt eine YAML-Datei, pro Dateistand wird nur einmal geparst.
+
+    Der Cache lebt über Requests hinweg (begrenzt auf 4096 Einträge); geänderte
+    Dateien werden über mtime/Größe automatisch neu geparst. Das Ergebnis wird
+    geteilt und darf nicht verändert werden; öffentliche Funktionen geben Kopien
+    (_copy_tasks) bzw. neu gebaute Strukturen zurück.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    return _load_yaml_cached(path, st.st_mtime_ns, st.st_size)
+
+
+def _copy_tasks(tasks: list) -> list:
+    """Flache Kopie einer gecachten Task-Liste inkl. der Task-Dicts."""
+    return [dict(t) if isinstance(t, dict) else t for t in tasks]
+
+
+def index_repo(repo_path: str) -> RepoIndex:
+    """Indiziert Inventories, Playbook-Kandidaten und Rollen in einem os.walk.
+
+    Inventories: Dateien unterhalb von inventory/ bzw. inventories/ (ohne
+    group_vars/host_vars) sowie hosts-Dateien im Root. Playbook-Kandidaten:
+    *.yml/*.yaml direkt in einem playbooks/-Verzeichnis oder im Root, nicht
+    unterhalb von inventory/, inventories/ oder roles/. Rollen: Unterverzeichnisse
+    von roles/ (der erste Fund gewinnt).
+
+    Rolleninhalte (files/, templates/, molecule/, ...) werden nicht betreten:
+    tasks/ und meta/ werden direkt adressiert. Inventories innerhalb einer Rolle
+    (z.B. molecule/*/inventory) werden deshalb nicht gefunden.
+
+    Verzeichnis-Symlinks (z.B. ein verlinktes inventory/) werden verfolgt, jedes
+    Ziel höchstens einmal und nie zurück in ein eigenes Elternverzeichnis.
+    """
+    index = RepoIndex()
+    root_real = os.path.realpath(repo_path)
+    # Reale Ziele bereits verfolgter Verzeichnis-Symlinks (Schutz vor Zyklen)
+    followed = {root_real}
+    # Pfad -> (unter inventory/, unter group_vars/host_vars, keine Playbooks, realer Pfad)
+    flags = {repo_path: (False, False, False, root_real)}
+    for dirpath, dirnames, filenames in os.walk(repo_path, followlinks=True):
+        in_inventory, in_vars, no_playbooks, real_dir = flags.pop(dirpath)
+        dirnames[:] = [d for d in dirnames if not d.startswith(".") and d not in _SKIP_DIRS]
+        name = os.path.basename(dirpath)
+        is_root = dirpath == repo_path
+
+        # Der Repo-Root selbst zählt nie als roles/, auch wenn er so heißt
+        if name == "roles" and not is_root:
+            for role_name in dirnames:
+                index.roles.setdefault(role_name, os.path.join(dirpath, role_name))
+            dirnames[:] = []
+
+        kept = []
+        for d in dirnames:
+            path = os.path.join(dirpath, d)
+            real = os.path.join(real_dir, d)
+            if os.path.islink(path):
+                real = os.path.realpath(path)
+                if (
+                    real in followed
+                    or real_dir == real
+                    or real_dir.startswith(real + os.sep)
+                ):
+                    continue
+                followed.add(real)
+            kept.append(d)
+            flags[path] = (
+                in_inventory or d in _INVENTORY_DIRS,
+                in_vars or d in _VARS_DIRS,
+                no_playbooks or d in _NO_PLAYBOOK_DIRS,
+                real,
+            )
+        dirnames[:] = kept
+
+        playbook_dir = (is_root or name == "playbooks") and not no_playbooks
+        for filename in filenames:
+            if filename.startswith("."):
+                continue
+            is_inventory = (in_inventory and not in_vars) or (is_root and filename in _HOSTS_FILES)
+            is_candidate = playbook_dir and filename.endswith((".yml", ".yaml"))
+            if not (is_inventory or is_candidate):
+                continue
+            path = os.path.join(dirpath, filename)
+            # Nur echte Dateien (os.walk liefert auch kaputte Symlinks)
+            if not os.path.isfile(path):
+                continue
+            if is_inventory:
+                index.inventories.append(path)
+            if is_candidate:
+                index.playbook_candidates.append(path)
+
+    index.inventories.sort()
+    index.playbook_candidates.sort()
+    return index
+
+
+def _role_name(entry: object, keys: tuple[str, ...] = ("role", "name")) -> str | None:
+    """Rollenname aus einem String- oder Dict-Eintrag (roles:, dependencies:, include_role:)."""
+    if type(entry) is dict:
+        for key in keys:
+            name = entry.get(key)
+            if name:
+                return name
+        return None
+    return str(entry)
+
+
+def find_role_tasks(
+    repo_path: str, role_name: str, role_dirs: dict[str, str] | None = None
+) -> list[dict]:
+    """Sucht die Tasks einer Rolle im roles/ Verzeichnis.
+
+    role_dirs ist der Rollen-Index eines Laufs (RepoIndex.roles); ohne Angabe
+    wird das Repository für diesen Aufruf indiziert.
+    """
+    if role_dirs is None:
+        role_dirs = index_repo(repo_path).roles
+    role_dir = role_dirs.get(role_name)
+    if role_dir is None:
+        return []
+    for filename in ("main.yml", "main.yaml"):
+        role_file = os.path.join(role_dir, "tasks", filename)
+        if not os.path.isfile(role_file):
+            continue
+        try:
+            tasks = _load_yaml(role_file)
+            if tasks and isinstance(tasks, list):
+                return _copy_tasks(tasks)
+        except (yaml.YAMLError, IOError) as e:
+            logger.warning(f"Konnte Role nicht laden: {role_file} - {e}")
     return []
 
 
-def find_role_dependencies(repo_path: str, role_name: str) -> list[str]:
-    """Sucht die Abhängigkeiten einer Rolle in meta/main.yml."""
-    meta_paths = [
-        f"{repo_path}/**/roles/{role_name}/meta/main.yml",
-        f"{repo_path}/**/roles/{role_name}/meta/main.yaml",
-    ]
-    for pattern in meta_paths:
-        for meta_file in glob.glob(pattern, recursive=True):
-            try:
-                with open(meta_file, encoding="utf-8") as f:
-                    meta = yaml.safe_load(f)
-                    if meta and isinstance(meta, dict):
-                        deps = meta.get("dependencies", [])
-                        result = []
-                        for dep in deps or []:
-                            if isinstance(dep, dict):
-                                name = dep.get("role") or dep.get("name")
-                            else:
-                                name = str(dep)
-                            if name:
-                                result.append(name)
-                        return result
-            except (yaml.YAMLError, IOError) as e:
-                logger.warning(f"Konnte Meta nicht laden: {meta_file} - {e}")
+def find_role_dependencies(
+    repo_path: str, role_name: str, role_dirs: dict[str, str] | None = None
+) -> list[str]:
+    """Sucht die Abhängigkeiten einer Rolle in meta/main.yml (role_dirs wie bei find_role_tasks)."""
+    if role_dirs is None:
+        role_dirs = index_repo(repo_path).roles
+    role_dir = role_dirs.get(role_name)
+    if role_dir is None:
+        return []
+    for filename in ("main.yml", "main.yaml"):
+        meta_file = os.path.join(role_dir, "meta", filename)
+        if not os.path.isfile(meta_file):
+            continue
+        try:
+            meta = _load_yaml(meta_file)
+            if meta and isinstance(meta, dict):
+                result = []
+                for dep in meta.get("dependencies") or ():
+                    name = _role_name(dep)
+                    if name:
+                        result.append(name)
+                return result
+        except (yaml.YAMLError, IOError) as e:
+            logger.warning(f"Konnte Meta nicht laden: {meta_file} - {e}")
     return []
 
 
-def load_included_tasks(repo_path: str, task_file: str, base_path: str) -> list[dict]:
-    """Lädt eingebundene Task-Dateien."""
-    if not task_file:
-        return []
+@lru_cache(maxsize=4096)
+def _realpath(path: str) -> str:
+    """os.path.realpath mit Cache; geteilte Imports/Includes werden oft aufgelöst.
 
-    possible_paths = [
-        os.path.join(os.path.dirname(base_path), task_file),
+    Der Cache ist prozessweit und wird nicht geleert (parallele Requests nutzen
+    ihn gleichzeitig); nur geänderte Symlinks unter gleichem Pfad bleiben alt.
+    """
+    return os.path.realpath(path)
+
+
+def _include_candidates(repo_path: str, task_file: str, base_dir: str) -> list[str]:
+    """Mögliche Pfade einer eingebundenen Task-Datei, in Suchreihenfolge."""
+    return [
+        os.path.join(base_dir, task_file),
         os.path.join(repo_path, task_file),
     ]
 
-    for path in possible_paths:
-        if os.path.exists(path):
+
+def _resolve_include(repo_path: str, task_file: str, base_dir: str) -> str | None:
+    """Liefert den kanonischen Pfad der ersten existierenden Include-Datei."""
+    if not task_file:
+        return None
+    for path in _include_candidates(repo_path, task_file, base_dir):
+        if os.path.isfile(path):
+            return _realpath(path)
+    return None
+
+
+def load_included_tasks(repo_path: str, task_file: str, base_dir: str) -> list[dict]:
+    """Lädt eingebundene Task-Dateien (relativ zu base_dir oder zum Repo-Root)."""
+    if not task_file:
+        return []
+
+    for path in _include_candidates(repo_path, task_file, base_dir):
+        if os.path.isfile(path):
             try:
-                with open(path, encoding="utf-8") as f:
-                    tasks = yaml.safe_load(f)
-                    if tasks and isinstance(tasks, list):
-                        return tasks
+                tasks = _load_yaml(path)
+                if tasks and isinstance(tasks, list):
+                    return _copy_tasks(tasks)
             except (yaml.YAMLError, IOError) as e:
                 logger.warning(f"Konnte Task-Datei nicht laden: {path} - {e}")
     return []
 
 
-def _parse_yaml_group(groups: dict, group_name: str, content: object) -> None:
-    """Rekursiv YAML-Inventory-Gruppen parsen, inkl. children."""
-    if content is None or not isinstance(content, dict):
-        groups[group_name] = []
-        return
+def _walk_yaml_groups(groups: dict, items: Iterable[tuple[str, object]]) -> None:
+    """Befüllt groups aus (Name, Inhalt)-Paaren inkl. children in einem Stack-Durchlauf."""
+    stack = list(items)
+    stack.reverse()
+    while stack:
+        name, node = stack.pop()
+        if node is None or not isinstance(node, dict):
+            groups[name] = []
+            continue
+
+        hosts = node.get("hosts")
+        groups[name] = list(hosts) if hosts and isinstance(hosts, dict) else []
+
+        children = node.get("children")
+        if children and isinstance(children, dict):
+            stack.extend(reversed(children.items()))
 
-    hosts = content.get("hosts", {})
-    groups[group_name] = list(hosts.keys()) if hosts and isinstance(hosts, dict) else []
 
-    children = content.get("children", {})
-    if children and isinstance(children, dict):
-        for child_name, child_content in children.items():
-            _parse_yaml_group(groups, child_name, child_content)
+def _parse_yaml_group(groups: dict, group_name: str, content: object) -> None:
+    """YAML-Inventory-Gruppe inkl. children parsen (iterativ, Preorder)."""
+    _walk_yaml_groups(groups, [(group_name, content)])
 
 
 def parse_ini_inventory(inv_path: str) -> dict[str, list[str]]:
-    """Parst ein INI-Format Inventory."""
+    """Parst ein INI-Format Inventory.
+
+    Die Datei wird binär gelesen; dekodiert werden nur Gruppen- und Hostnamen,
+    die im Ergebnis landen (Variablen und Kommentare bleiben Bytes).
+    """
     groups = {}
     current_group = None
-    current_section = "hosts"
+    current_section = b"hosts"
 
-    with open(inv_path, encoding="utf-8") as f:
+    with open(inv_path, "rb") as f:
         for line in f:
             line = line.strip()
-            if not line or line.startswith('#') or line.startswith(';'):
+            if not line or line.startswith((b"#", b";")):
                 continue
 
-            match = re.match(r'^\[([^:\]]+)(?::(\w+))?\]$', line)
+            match = _INI_SECTION_RE.match(line)
             if match:
-                current_group = match.group(1)
-                current_section = match.group(2) or "hosts"
+                current_group = match.group(1).decode("utf-8")
+                current_section = match.group(2) or b"hosts"
                 if current_group not in groups:
                     groups[current_group] = []
                 continue
@@ -125,37 +313,48 @@ def parse_ini_inventory(inv_path: str) -> dict[str, list[str]]:
             if current_group is None:
                 continue
 
-            if current_section == "hosts":
-                host = line.split()[0]
+            if current_section == b"hosts":
+                host = line.split()[0].decode("utf-8")
                 if host:
                     groups[current_group].append(host)
-            elif current_section == "children":
-                child_group = line.split()[0]
+            elif current_section == b"children":
+                child_group = line.split()[0].decode("utf-8")
                 if child_group not in groups:
                     groups[child_group] = []
 
     return groups
 
 
+def _looks_like_ini(inv_path: str) -> bool:
+    """Erkennt INI-Inventories am ersten relevanten Zeichen ('[' einer Section)."""
+    try:
+        with open(inv_path, "rb") as f:
+            head = f.read(4096)
+    except OSError:
+        return False
+    for line in head.splitlines():
+        line = line.strip()
+        if not line or line.startswith((b"#", b";")):
+            continue
+        return line.startswith(b"[")
+    return False
+
+
 def parse_inventory(inv_path: str) -> dict[str, list[str]]:
     """Parst ein Inventory (YAML oder INI) und gibt Groups mit Hosts zurück."""
-    # Versuche YAML zu parsen
-    try:
-        with open(inv_path, encoding="utf-8") as f:
-            inv_data = yaml.safe_load(f)
-
-        if inv_data and isinstance(inv_data, dict):
-            groups = {}
-            for group, content in inv_data.items():
-                _parse_yaml_group(
-                    groups, group,
-                    content if isinstance(content, dict) else {}
-                )
-            return groups
-    except yaml.YAMLError:
-        pass
-
-    # Fallback: INI-Format
+    # Versuche YAML zu parsen, außer die Datei beginnt eindeutig mit einer INI-Section
+    if not _looks_like_ini(inv_path):
+        try:
+            inv_data = _load_yaml(inv_path)
+
+            if inv_data and isinstance(inv_data, dict):
+                groups = {}
+                _walk_yaml_groups(groups, inv_data.items())
+                return groups
+        except yaml.YAMLError:
+            pass
+
+    # INI-Format (direkt oder als Fallback)
     try:
         return parse_ini_inventory(inv_path)
     except IOError as e:
@@ -172,8 +371,7 @@ def parse_playbook(pb_path: str, repo_path: str) -> dict:
     }
 
     try:
-        with open(pb_path, encoding="utf-8") as f:
-            pb_data = yaml.safe_load(f)
+        pb_data = _load_yaml(pb_path)
     except yaml.YAMLError as e:
         raise ValueError(f"Ungültiges YAML in {pb_path}: {e}")
 
@@ -181,6 +379,12 @@ def parse_playbook(pb_path: str, repo_path: str) -> dict:
         logger.warning(f"Leeres oder ungültiges Playbook: {pb_path}")
         return result
 
+    # Basisverzeichnis für import_playbook und include_tasks einmal bestimmen
+    base_dir = os.path.dirname(pb_path)
+    # Include-Cache nur für dieses Playbook: parse_playbook läuft parallel in
+    # mehreren Threads, halb expandierte Listen dürfen nicht geteilt werden
+    include_cache: dict[tuple[str, str, str], list[dict]] = {}
+
     for play in pb_data:
         if not isinstance(play, dict):
             continue
@@ -188,9 +392,7 @@ def parse_playbook(pb_path: str, repo_path: str) -> dict:
         # import_playbook erkennen
         import_pb = play.get("import_playbook")
         if import_pb:
-            resolved = os.path.normpath(
-                os.path.join(os.path.dirname(pb_path), import_pb)
-            )
+            resolved = os.path.normpath(os.path.join(base_dir, import_pb))
             result["imported_playbooks"].append(resolved)
             continue
 
@@ -212,30 +414,30 @@ def parse_playbook(pb_path: str, repo_path: str) -> dict:
         play_tags = play.get("tags")
         if play_tags is not None:
             if isinstance(play_tags, list):
-                play_info["tags"] = play_tags
+                play_info["tags"] = list(play_tags)
             else:
                 play_info["tags"] = [str(play_tags)]
 
         # Roles extrahieren
-        for role in play.get("roles", []) or []:
-            if isinstance(role, dict):
-                role_name = role.get("role") or role.get("name")
-            else:
-                role_name = str(role)
+        for role in play.get("roles") or ():
+            role_name = _role_name(role)
             if role_name:
                 play_info["roles"].append(role_name)
 
         # Tasks extrahieren (pre_tasks, tasks, post_tasks)
         all_tasks = []
         for task_type in ["pre_tasks", "tasks", "post_tasks"]:
-            for task in play.get(task_type, []) or []:
+            for task in play.get(task_type) or ():
                 if isinstance(task, dict):
-                    task_info = extract_task_info(task, repo_path, pb_path)
+                    task_info = extract_task_info(task, repo_path, base_dir, include_cache)
                     all_tasks.append(task_info)
+                    # Rollen können nur in role/block/include-Tasks stecken
+                    if task_info["type"] in ("role", "block", "include"):
+                        play_info["has_role_tasks"] = True
         play_info["tasks"] = all_tasks
 
         # Handlers extrahieren
-        for handler in play.get("handlers", []) or []:
+        for handler in play.get("handlers") or ():
             if isinstance(handler, dict):
                 play_info["handlers"].append(handler.get("name", "unnamed_handler"))
 
@@ -244,8 +446,8 @@ def parse_playbook(pb_path: str, repo_path: str) -> dict:
     return result
 
 
-def extract_task_info(task: dict, repo_path: str, base_path: str) -> dict:
-    """Extrahiert Informationen aus einem Task."""
+def _base_task_info(task: dict) -> dict:
+    """Extrahiert die typunabhängigen Attribute eines Tasks."""
     task_info = {
         "name": task.get("name", "unnamed_task"),
         "type": "task"
@@ -255,7 +457,7 @@ def extract_task_info(task: dict, repo_path: str, base_path: str) -> dict:
     when = task.get("when")
     if when is not None:
         if isinstance(when, list):
-            task_info["when"] = when
+            task_info["when"] = list(when)
         else:
             task_info["when"] = [str(when)]
 
@@ -263,7 +465,7 @@ def extract_task_info(task: dict, repo_path: str, base_path: str) -> dict:
     tags = task.get("tags")
     if tags is not None:
         if isinstance(tags, list):
-            task_info["tags"] = tags
+            task_info["tags"] = list(tags)
         else:
             task_info["tags"] = [str(tags)]
 
@@ -280,114 +482,210 @@ def extract_task_info(task: dict, repo_path: str, base_path: str) -> dict:
         if isinstance(notify, str):
             task_info["notify"] = [notify]
         elif isinstance(notify, list):
-            task_info["notify"] = notify
-
-    # block / rescue / always
-    if "block" in task:
-        task_info["type"] = "block"
-        task_info["block_tasks"] = []
-        for section in ["block", "rescue", "always"]:
-            for t in task.get(section, []) or []:
-                if isinstance(t, dict):
-                    task_info["block_tasks"].append(
-                        extract_task_info(t, repo_path, base_path)
-                    )
-        return task_info
-
-    # include_role / import_role
-    role_info = task.get("include_role") or task.get("import_role")
-    if role_info:
-        role_name = role_info.get("name") if isinstance(role_info, dict) else str(role_info)
-        task_info["type"] = "role"
-        task_info["role_name"] = role_name
-        return task_info
-
-    # include_tasks / import_tasks
-    include_file = task.get("include_tasks") or task.get("import_tasks")
-    if include_file:
-        if isinstance(include_file, dict):
-            include_file = include_file.get("file", "")
-        task_info["type"] = "include"
-        task_info["include_file"] = str(include_file)
-        task_info["included_tasks"] = []
-
-        # Rekursiv eingebundene Tasks laden
-        included = load_included_tasks(repo_path, str(include_file), base_path)
-        for t in included:
-            if isinstance(t, dict):
-                task_info["included_tasks"].append(extract_task_info(t, repo_path, base_path))
-
-        return task_info
+            task_info["notify"] = list(notify)
 
     return task_info
 
 
+def extract_task_info(
+    task: dict,
+    repo_path: str,
+    base_dir: str,
+    include_cache: dict[tuple[str, str, str], list[dict]] | None = None
+) -> dict:
+    """Extrahiert Informationen aus einem Task inkl. Blocks und Includes (iterativ).
+
+    include_cache ((repo_path, base_dir, realpath) -> Tasks) teilt bereits
+    expandierte Include-Dateien zwischen den Tasks eines Playbooks; ohne
+    Angabe gilt er nur für diesen Aufruf.
+    """
+    if include_cache is None:
+        include_cache = {}
+    root: list[dict] = []
+    # Einträge: (Task, Zielliste, None) oder (None, [], Include-Key) als Ende-Markierung
+    stack: list[tuple[dict | None, list[dict], tuple[str, str, str] | None]] = [
+        (task, root, None)
+    ]
+    # Include-Dateien, die gerade expandiert werden (Zykluserkennung)
+    active: set[tuple[str, str, str]] = set()
+
+    while stack:
+        current, target, leave_key = stack.pop()
+        if current is None:
+            active.discard(leave_key)
+            continue
+
+        task_info = _base_task_info(current)
+        target.append(task_info)
+
+        # block / rescue / always
+        if "block" in current:
+            task_info["type"] = "block"
+            task_info["block_tasks"] = []
+            children = [
+                t
+                for section in ["block", "rescue", "always"]
+                for t in current.get(section) or ()
+                if isinstance(t, dict)
+            ]
+            stack.extend((t, task_info["block_tasks"], None) for t in reversed(children))
+            continue
+
+        # include_role / import_role
+        role_info = current.get("include_role") or current.get("import_role")
+        if role_info:
+            role_name = _role_name(role_info, ("name",))
+            task_info["type"] = "role"
+            task_info["role_name"] = role_name
+            continue
+
+        # include_tasks / import_tasks
+        include_file = current.get("include_tasks") or current.get("import_tasks")
+        if include_file:
+            if isinstance(include_file, dict):
+                include_file = include_file.get("file", "")
+            include_file = str(include_file)
+            task_info["type"] = "include"
+            task_info["include_file"] = include_file
+
+            resolved = _resolve_include(repo_path, include_file, base_dir)
+            if resolved is None:
+                task_info["included_tasks"] = []
+                continue
+            key = (repo_path, base_dir, resolved)
+            if key in active:
+                # Zyklisches Include: nicht erneut expandieren, nur markieren
+                task_info["included_tasks"] = []
+                task_info["cyclic"] = True
+                continue
+            cached = include_cache.get(key)
+            if cached is not None:
+                task_info["included_tasks"] = cached
+                continue
+
+            # Jede Include-Datei wird nur einmal expandiert
+            included: list[dict] = []
+            include_cache[key] = included
+            task_info["included_tasks"] = included
+            active.add(key)
+            stack.append((None, [], key))
+            # Genau die Datei laden, die auch den Cache-/Zyklus-Key bildet
+            try:
+                tasks = _load_yaml(resolved)
+            except (yaml.YAMLError, OSError) as e:
+                logger.warning(f"Konnte Task-Datei nicht laden: {resolved} - {e}")
+                tasks = None
+            if not isinstance(tasks, list):
+                continue
+            children = [t for t in tasks if isinstance(t, dict)]
+            stack.extend((t, included, None) for t in reversed(children))
+
+    return root[0]
+
+
 def _collect_roles_from_tasks(tasks: list[dict], roles: set[str]) -> None:
-    """Sammelt Rollen aus Tasks rekursiv (inkl. Blocks)."""
-    for task in tasks:
+    """Sammelt Rollen aus Tasks (inkl. Blocks und Includes) mit explizitem Stack.
+
+    Geteilte Include-Listen werden nur einmal besucht; das schützt auch vor
+    Zyklen in der Task-Struktur.
+    """
+    stack = list(tasks)
+    seen: set[int] = set()
+    while stack:
+        task = stack.pop()
         if task["type"] == "role":
             roles.add(task["role_name"])
-        elif task["type"] == "block":
-            _collect_roles_from_tasks(task.get("block_tasks", []), roles)
+            continue
+        if task["type"] == "block":
+            children = task.get("block_tasks")
         elif task["type"] == "include":
-            _collect_roles_from_tasks(task.get("included_tasks", []), roles)
+            children = task.get("included_tasks")
+        else:
+            continue
+        if children and id(children) not in seen:
+            seen.add(id(children))
+            stack.extend(children)
 
 
 def parse_all(inventory_paths: list[str], playbook_paths: list[str], repo_path: str) -> AnsibleData:
     """Parst alle Inventories und Playbooks."""
     data = AnsibleData()
 
-    # Inventories parsen
-    for inv_path in inventory_paths:
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        # Inventories parallel parsen; map() liefert in Eingabereihenfolge,
+        # spätere Inventories überschreiben Gruppen wie bisher
         try:
-            groups = parse_inventory(inv_path)
-            data.groups.update(groups)
+            for groups in executor.map(parse_inventory, inventory_paths):
+                data.groups.update(groups)
         except ValueError as e:
             logger.error(str(e))
             raise
 
-    # Playbooks parsen (inkl. import_playbook-Auflösung)
-    parsed_paths = set()
-    pending = list(playbook_paths)
-
-    while pending:
-        pb_path = pending.pop(0)
-        if pb_path in parsed_paths:
-            continue
-        parsed_paths.add(pb_path)
-
-        try:
-            pb_data = parse_playbook(pb_path, repo_path)
-            data.playbooks[pb_path] = pb_data
-
-            # Roles sammeln
-            for play in pb_data["plays"]:
-                for role_name in play["roles"]:
-                    data.roles.add(role_name)
-                _collect_roles_from_tasks(play["tasks"], data.roles)
-
-            # Importierte Playbooks zur Queue hinzufügen
-            for imp_path in pb_data.get("imported_playbooks", []):
-                if os.path.exists(imp_path) and imp_path not in parsed_paths:
-                    pending.append(imp_path)
-
-        except ValueError as e:
-            logger.error(str(e))
-            raise
-
-    # Role-Tasks und Dependencies laden (transitiv)
-    all_roles = set(data.roles)
-    processed_roles = set()
-
-    while all_roles - processed_roles:
-        for role_name in list(all_roles - processed_roles):
-            processed_roles.add(role_name)
-            data.role_tasks[role_name] = find_role_tasks(repo_path, role_name)
-            deps = find_role_dependencies(repo_path, role_name)
-            if deps:
-                data.role_dependencies[role_name] = deps
-                for dep in deps:
-                    all_roles.add(dep)
-                    data.roles.add(dep)
+        # Playbooks parsen (inkl. import_playbook-Auflösung), rundenweise parallel
+        # Kanonische Pfade (realpath), damit ./a.yml, Symlinks etc. nur einmal geparst werden
+        parsed_paths = set()
+        pending = deque(_realpath(p) for p in playbook_paths)
+
+        while pending:
+            batch = []
+            while pending:
+                pb_path = pending.popleft()
+                if pb_path in parsed_paths:
+                    continue
+                parsed_paths.add(pb_path)
+                batch.append(pb_path)
+
+            results = executor.map(lambda p: parse_playbook(p, repo_path), batch)
+            try:
+                for pb_path, pb_data in zip(batch, results):
+                    data.playbooks[pb_path] = pb_data
+
+                    # Roles sammeln
+                    for play in pb_data["plays"]:
+                        for role_name in play["roles"]:
+                            data.roles.add(role_name)
+                        if play.get("has_role_tasks"):
+                            _collect_roles_from_tasks(play["tasks"], data.roles)
+
+                    # Importierte Playbooks zur Queue hinzufügen
+                    for imp_path in pb_data.get("imported_playbooks", []):
+                        imp_path = _realpath(imp_path)
+                        if os.path.exists(imp_path) and imp_path not in parsed_paths:
+                            pending.append(imp_path)
+
+            except ValueError as e:
+                logger.error(str(e))
+                raise
+
+        # Role-Tasks und Dependencies laden (transitiv), rundenweise parallel
+        # Rollen-Index nur für diesen Lauf: neue/geänderte Rollen sind beim nächsten
+        # Aufruf sichtbar, ohne globalen Zustand anderer Requests zurückzusetzen
+        role_dirs = index_repo(repo_path).roles if data.roles else {}
+        pending_roles = deque(data.roles)
+        seen_roles = set()
+
+        while pending_roles:
+            batch = []
+            while pending_roles:
+                role_name = pending_roles.popleft()
+                if role_name in seen_roles:
+                    continue
+                seen_roles.add(role_name)
+                batch.append(role_name)
+
+            task_results = executor.map(
+                lambda r: find_role_tasks(repo_path, r, role_dirs), batch
+            )
+            dep_results = executor.map(
+                lambda r: find_role_dependencies(repo_path, r, role_dirs), batch
+            )
+            for role_name, tasks, deps in zip(batch, task_results, dep_results):
+                data.role_tasks[role_name] = tasks
+                if deps:
+                    data.role_dependencies[role_name] = deps
+                    for dep in deps:
+                        data.roles.add(dep)
+                        if dep not in seen_roles:
+                            pending_roles.append(dep)
 
     return data
@@ -1,6 +1,7 @@
 """Ansible UML Visualizer - FastAPI Web Application."""
 
 from fastapi import FastAPI, Request, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 import git
@@ -8,10 +9,11 @@ from git.exc import GitCommandError
 import os
 import tempfile
 import shutil
-import glob
 import logging
+import mmap
+from concurrent.futures import ThreadPoolExecutor
 
-from ansible_parser import parse_all
+from ansible_parser import index_repo, parse_all
 from mermaid_generator import generate_diagram
 
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +22,34 @@ logger = logging.getLogger(__name__)
 app = FastAPI()
 templates = Jinja2Templates(directory="templates")
 
+# Obergrenze für parallel geöffnete Dateien beim Playbook-Check
+_SCAN_WORKERS = 32
+
+
+def _is_playbook(path: str) -> bool:
+    """Prüft per Byte-Substring-Suche, ob eine Datei wie ein Playbook aussieht.
+
+    Dateien bis zu einer Speicherseite werden direkt gelesen, größere per mmap.
+    """
+    with open(path, "rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if size == 0:
+            return False
+        if size <= mmap.PAGESIZE:
+            data = fh.read()
+            return b"hosts:" in data or b"import_playbook:" in data
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm.find(b"hosts:") != -1 or mm.find(b"import_playbook:") != -1
+
+
+def _check_playbook(path: str) -> bool:
+    """Wie _is_playbook, nicht lesbare Dateien werden geloggt und übersprungen."""
+    try:
+        return _is_playbook(path)
+    except OSError as e:
+        logger.warning(f"Konnte Datei nicht lesen: {path} - {e}")
+        return False
+
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
@@ -27,9 +57,8 @@ async def index(request: Request):
     return templates.TemplateResponse(request, "index.html")
 
 
-@app.post("/scan", response_class=HTMLResponse)
-async def scan_repo(request: Request, repo_input: str = Form(...)):
-    """Repository scannen und Inventories/Playbooks finden."""
+def _scan_repository(repo_input: str) -> tuple[str, list[str], list[str]]:
+    """Repository öffnen bzw. klonen und Inventories/Playbooks finden (blockierend)."""
     temp_dir = None
     try:
         if os.path.exists(repo_input):
@@ -37,75 +66,53 @@ async def scan_repo(request: Request, repo_input: str = Form(...)):
         else:
             temp_dir = tempfile.mkdtemp()
             repo_path = temp_dir
-            repo = git.Repo.clone_from(repo_input, repo_path)
-            try:
-                repo.git.checkout("main")
-            except GitCommandError:
-                repo.git.checkout("master")
-
-        # Inventories suchen (mehrere Patterns)
-        inventory_patterns = [
-            f"{repo_path}/**/inventory/*",
-            f"{repo_path}/**/inventories/*",
-            f"{repo_path}/**/inventory/**/*",
-            f"{repo_path}/**/inventories/**/*",
-        ]
-        inventories = set()
-        for pattern in inventory_patterns:
-            for f in glob.glob(pattern, recursive=True):
-                if os.path.isfile(f) and '/group_vars/' not in f and '/host_vars/' not in f:
-                    inventories.add(f)
-
-        # Hosts-Dateien im Root
-        for name in ["hosts", "hosts.yml", "hosts.yaml", "hosts.ini"]:
-            path = os.path.join(repo_path, name)
-            if os.path.isfile(path):
-                inventories.add(path)
-
-        inventories = sorted(inventories)
-
-        # Playbooks suchen (mehrere Patterns, inkl. .yaml und Root)
-        playbook_patterns = [
-            f"{repo_path}/**/playbooks/*.yml",
-            f"{repo_path}/**/playbooks/*.yaml",
-            f"{repo_path}/*.yml",
-            f"{repo_path}/*.yaml",
-        ]
-        playbooks = []
-        seen = set()
-        for pattern in playbook_patterns:
-            for f in glob.glob(pattern, recursive=True):
-                if f in seen:
-                    continue
-                if '/inventory/' in f or '/inventories/' in f or '/roles/' in f:
-                    continue
-                seen.add(f)
-                try:
-                    with open(f, encoding="utf-8") as file:
-                        content = file.read()
-                        if "hosts:" in content or "import_playbook:" in content:
-                            playbooks.append(f)
-                except (IOError, UnicodeDecodeError) as e:
-                    logger.warning(f"Konnte Datei nicht lesen: {f} - {e}")
+            # Nur der Stand des Default-Branches (HEAD) wird gelesen: flacher Klon
+            # ohne Tags genügt. Kein --filter=blob:none, der Checkout bräuchte die
+            # Blobs ohnehin sofort (nur zusätzliche Roundtrips)
+            git.Repo.clone_from(
+                repo_input, repo_path, depth=1, single_branch=True, no_tags=True
+            )
+
+        repo_index = index_repo(repo_path)
+        inventories = repo_index.inventories
+
+        # Kandidaten parallel prüfen; map() erhält die sortierte Reihenfolge
+        candidates = repo_index.playbook_candidates
+        with ThreadPoolExecutor(max_workers=_SCAN_WORKERS) as executor:
+            matches = list(executor.map(_check_playbook, candidates))
+        playbooks = [f for f, is_pb in zip(candidates, matches) if is_pb]
 
         logger.info(f"Gefundene Inventories: {inventories}")
         logger.info(f"Gefundene Playbooks: {playbooks}")
 
+        return repo_path, inventories, playbooks
+    except Exception:
+        # Läuft bereits im Worker-Thread; Aufräumfehler sollen den Originalfehler nicht verdecken
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+
+@app.post("/scan", response_class=HTMLResponse)
+async def scan_repo(request: Request, repo_input: str = Form(...)):
+    """Repository scannen und Inventories/Playbooks finden."""
+    try:
+        # Klonen und Dateisystem-Walk blockieren; im Threadpool ausführen
+        repo_path, inventories, playbooks = await run_in_threadpool(
+            _scan_repository, repo_input
+        )
+
         return templates.TemplateResponse(request, "index.html", {
             "inventories": inventories,
             "playbooks": playbooks,
             "repo_path": repo_path
         })
     except GitCommandError as e:
-        if temp_dir and os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
         logger.error(f"Git-Fehler: {e}")
         return templates.TemplateResponse(request, "index.html", {
             "error": f"Git-Fehler: {e}"
         })
     except Exception as e:
-        if temp_dir and os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
         logger.error(f"Unerwarteter Fehler: {e}")
         return templates.TemplateResponse(request, "index.html", {
             "error": f"Fehler beim Scannen: {e}"
@@ -123,10 +130,10 @@ async def generate_diagram_route(
     """Mermaid-Diagramm generieren."""
     try:
         # Ansible-Daten parsen
-        ansible_data = parse_all(inventory, playbook, repo_path)
+        ansible_data = await run_in_threadpool(parse_all, inventory, playbook, repo_path)
 
         # Mermaid-Diagramm generieren
-        diagram = generate_diagram(ansible_data, layout, repo_path)
+        diagram = await run_in_threadpool(generate_diagram, ansible_data, layout, repo_path)
 
         logger.info(f"Generiertes Mermaid-Diagramm mit {len(diagram.splitlines())} Zeilen")
 
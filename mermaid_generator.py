@@ -2,12 +2,30 @@
 
 import re
 import os
+import sys
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import islice
 from ansible_parser import AnsibleData
 
 logger = logging.getLogger(__name__)
 
+_SANITIZE_RE = re.compile(r'[^\w\-]')
+_UNDERSCORE_RE = re.compile(r'__+')
+
+# Maximale Anzahl Node-IDs pro "class"-Zeile
+_CLASS_CHUNK = 256
+
+# Fertige Diagramme für generate_diagram_cached: (Layout, Repo, Fingerprint) -> Text
+_DIAGRAM_CACHE_SIZE = 32
+_diagram_cache: OrderedDict[tuple[str, str, str], str] = OrderedDict()
+_diagram_cache_lock = threading.Lock()
+
 
 # Styles für verschiedene Node-Typen
 STYLES = [
@@ -23,28 +41,42 @@ STYLES = [
 ]
 
 
-@dataclass
+@dataclass(slots=True)
 class DiagramNodes:
     """Container für gesammelte Diagram-Nodes."""
     groups: set = field(default_factory=set)
     hosts: set = field(default_factory=set)
-    playbooks: list = field(default_factory=list)
+    playbooks: set = field(default_factory=set)
     roles: set = field(default_factory=set)
-    tasks: list = field(default_factory=list)
+    tasks: set = field(default_factory=set)
     handlers: set = field(default_factory=set)
     includes: set = field(default_factory=set)
     tags: set = field(default_factory=set)
     becomes: set = field(default_factory=set)
 
+    def add(self, kind: str, node_id: object) -> bool:
+        """Fügt eine ID zu einer Set-Kategorie hinzu; True, wenn sie neu war."""
+        bucket = getattr(self, kind)
+        if node_id in bucket:
+            return False
+        bucket.add(node_id)
+        return True
+
 
+@lru_cache(maxsize=8192)
 def sanitize(text: str) -> str:
-    """Bereinigt Text für Mermaid-Node-IDs."""
+    """Bereinigt Text für Mermaid-Node-IDs (memoisiert, Namen wiederholen sich)."""
     text = text.strip()
-    text = re.sub(r'[^\w\-]', '_', text)
-    text = re.sub(r'__+', '_', text)
-    if re.match(r'^\d', text):
+    # Schnellpfad: ASCII-Bezeichner ohne "__" bleiben unverändert (kein Regex nötig)
+    if text.isascii() and text.isidentifier() and "__" not in text:
+        return sys.intern(text)
+    text = _SANITIZE_RE.sub('_', text)
+    text = _UNDERSCORE_RE.sub('_', text)
+    # isdecimal() entspricht \d (Unicode-Ziffern), ohne Regex-Aufruf
+    if text[:1].isdecimal():
         text = f"id_{text}"
-    return text
+    # IDs landen in Sets, Verbindungen und class-Zeilen: ein gemeinsames Objekt
+    return sys.intern(text)
 
 
 def escape_label(text: object) -> str:
@@ -52,45 +84,60 @@ def escape_label(text: object) -> str:
     return str(text).replace('"', "'")
 
 
-def generate_diagram(data: AnsibleData, layout: str = "LR", repo_path: str = "") -> str:
-    """Generiert ein Mermaid-Diagramm aus AnsibleData."""
-    lines = [f"graph {layout}"]
+def iter_diagram(data: AnsibleData, layout: str = "LR", repo_path: str = "") -> Iterator[str]:
+    """Erzeugt die Zeilen eines Mermaid-Diagramms aus AnsibleData.
+
+    Node-Zeilen werden abschnittsweise (pro Playbook) ausgegeben; nur
+    Verbindungen und Klassen-Zuordnungen bleiben bis zum Ende im Speicher.
+    """
     nodes = DiagramNodes()
     connections = []
     task_counter = 0
+    # Rollenname -> Node-ID, einmal pro Diagramm berechnet
+    role_ids = {name: sanitize(f"role_{name}") for name in data.roles}
+    # id() bereits expandierter included_tasks-Listen (Zustand des Durchlaufs)
+    expanded_includes: set[int] = set()
+    # Häufig aufgerufene Methoden einmal binden (Rollen-Tasks, Verbindungen)
+    add_task = nodes.tasks.add
+    add_connection = connections.append
+
+    yield f"graph {layout}"
 
     # === SPALTE 1: Inventory ===
-    lines.append('    subgraph inventory["Inventory"]')
-    lines.append('    direction TB')
+    yield '    subgraph inventory["Inventory"]'
+    yield '    direction TB'
 
     for group, hosts in data.groups.items():
         group_id = sanitize(group)
         nodes.groups.add(group_id)
-        lines.append(f'        {group_id}[["fa:fa-layer-group {group}"]]')
+        yield f'        {group_id}[["fa:fa-layer-group {group}"]]'
 
         for host in hosts:
             host_id = sanitize(host)
-            nodes.hosts.add(host_id)
-            lines.append(f'        {host_id}(("fa:fa-server {host}"))')
-            lines.append(f'        {group_id} --- {host_id}')
+            # Hosts in mehreren Gruppen: Node nur einmal, Kante pro Gruppe
+            if nodes.add("hosts", host_id):
+                yield f'        {host_id}(("fa:fa-server {host}"))'
+            yield f'        {group_id} --- {host_id}'
 
-    lines.append('    end')
+    yield '    end'
 
     # === SPALTE 2: Playbooks ===
-    lines.append('    subgraph playbooks_section["Playbooks"]')
-    lines.append('    direction TB')
+    yield '    subgraph playbooks_section["Playbooks"]'
+    yield '    direction TB'
 
+    # Puffer für die Zeilen eines Playbooks (die Helper hängen an eine Liste an)
+    lines = []
     for pb_path, pb_data in data.playbooks.items():
         pb_name = pb_data["name"]
         pb_id = sanitize(pb_name)
-        nodes.playbooks.append(pb_id)
+        nodes.playbooks.add(pb_id)
         lines.append(f'        {pb_id}["fa:fa-book {pb_name}"]')
 
         for play_idx, play in enumerate(pb_data["plays"]):
             hosts_target = play.get("hosts")
             if hosts_target:
                 group_id = sanitize(str(hosts_target))
-                connections.append(f'    {group_id} -->|"runs"| {pb_id}')
+                add_connection(f'    {group_id} -->|"runs"| {pb_id}')
 
             # Play-Level Tags/Become als eigene Nodes
             _add_tag_nodes(play, pb_id, lines, nodes)
@@ -98,40 +145,47 @@ def generate_diagram(data: AnsibleData, layout: str = "LR", repo_path: str = "")
 
             # Roles verbinden
             for role_name in play["roles"]:
-                role_id = sanitize(f"role_{role_name}")
+                role_id = _role_id(role_ids, role_name)
                 nodes.roles.add(role_id)
-                connections.append(f'    {pb_id} ==>|"uses"| {role_id}')
+                add_connection(f'    {pb_id} ==>|"uses"| {role_id}')
 
-            # Tasks verarbeiten
+            # Tasks verarbeiten (normale Tasks ohne Stack-Verwaltung)
             for task in play["tasks"]:
-                task_counter = _process_task(
-                    task, pb_id, lines, nodes, connections, task_counter
-                )
+                if task.get("type", "task") == "task":
+                    _process_plain_task(task, pb_id, lines, nodes, connections, task_counter)
+                    task_counter += 1
+                else:
+                    task_counter = _process_task(
+                        task, pb_id, lines, nodes, connections, task_counter,
+                        role_ids, expanded_includes
+                    )
 
             # Handlers (nur Node-Erstellung, Verbindungen kommen über notify)
             for handler_name in play["handlers"]:
                 handler_id = sanitize(f"handler_{handler_name}")
-                if handler_id not in nodes.handlers:
-                    nodes.handlers.add(handler_id)
+                if nodes.add("handlers", handler_id):
                     label = escape_label(handler_name)
                     lines.append(f'        {handler_id}(["fa:fa-bell {label}"])')
 
         # import_playbook-Verbindungen
-        for imp_path in pb_data.get("imported_playbooks", []):
+        for imp_path in pb_data.get("imported_playbooks") or ():
             imp_name = os.path.basename(imp_path)
             imp_id = sanitize(imp_name)
-            connections.append(f'    {pb_id} -->|"imports"| {imp_id}')
+            add_connection(f'    {pb_id} -->|"imports"| {imp_id}')
 
-    lines.append('    end')
+        yield from lines
+        lines.clear()
+
+    yield '    end'
 
     # === SPALTE 3: Roles ===
-    lines.append('    subgraph roles_section["Roles"]')
-    lines.append('    direction TB')
+    yield '    subgraph roles_section["Roles"]'
+    yield '    direction TB'
 
     for role_name in data.roles:
-        role_id = sanitize(f"role_{role_name}")
+        role_id = role_ids[role_name]
         nodes.roles.add(role_id)
-        lines.append(f'        {role_id}{{"fa:fa-cube {role_name}"}}')
+        yield f'        {role_id}{{"fa:fa-cube {role_name}"}}'
 
         # Role-Tasks
         role_tasks = data.role_tasks.get(role_name, [])
@@ -141,42 +195,96 @@ def generate_diagram(data: AnsibleData, layout: str = "LR", repo_path: str = "")
             task_name = rt.get("name", f"task_{task_counter}")
             rt_task_id = f"{role_id}_task_{task_counter}"
             label = escape_label(task_name)
-            nodes.tasks.append(rt_task_id)
-            lines.append(f'        {rt_task_id}["{label}"]')
-            lines.append(f'        {role_id} --> {rt_task_id}')
+            add_task(rt_task_id)
+            yield f'        {rt_task_id}["{label}"]'
+            yield f'        {role_id} --> {rt_task_id}'
             task_counter += 1
 
     # Role-Dependencies
     for role_name, deps in data.role_dependencies.items():
-        role_id = sanitize(f"role_{role_name}")
+        role_id = _role_id(role_ids, role_name)
         for dep in deps:
-            dep_id = sanitize(f"role_{dep}")
-            connections.append(f'    {role_id} -->|"depends"| {dep_id}')
+            dep_id = _role_id(role_ids, dep)
+            add_connection(f'    {role_id} -->|"depends"| {dep_id}')
 
-    lines.append('    end')
+    yield '    end'
 
-    # Verbindungen hinzufügen
-    lines.extend(connections)
+    # Verbindungen hinzufügen (doppelte Kanten nur einmal, Reihenfolge bleibt)
+    yield from dict.fromkeys(connections)
 
     # Styling
-    lines.extend(STYLES)
+    yield from STYLES
 
     # Klassen zuweisen
     _apply_classes(lines, nodes)
+    yield from lines
+
 
-    return "\n".join(lines)
+def generate_diagram(data: AnsibleData, layout: str = "LR", repo_path: str = "") -> str:
+    """Generiert ein Mermaid-Diagramm aus AnsibleData."""
+    return "\n".join(iter_diagram(data, layout, repo_path))
+
+
+def _fingerprint(data: AnsibleData) -> str:
+    """Stabiler Hash über die Felder, die iter_diagram tatsächlich liest.
+
+    Von Role-Tasks zählt nur der Name; repr() statt JSON, damit gemischte
+    Dict-Keys aus YAML oder geteilte Listen keinen Fehler auslösen.
+    """
+    role_task_names = {
+        role: [(rt.get("name"), "name" in rt) for rt in tasks if isinstance(rt, dict)]
+        for role, tasks in data.role_tasks.items()
+    }
+    dump = repr((
+        data.groups,
+        data.playbooks,
+        sorted(data.roles),
+        role_task_names,
+        data.role_dependencies,
+    ))
+    return hashlib.blake2b(dump.encode("utf-8", "backslashreplace"), digest_size=16).hexdigest()
+
+
+def generate_diagram_cached(data: AnsibleData, layout: str = "LR", repo_path: str = "") -> str:
+    """Wie generate_diagram, unveränderte Daten liefern das gespeicherte Diagramm.
+
+    Opt-in für Aufrufer, die dieselben Daten wiederholt rendern. AnsibleData
+    darf danach nicht mehr verändert werden; der Cache hält die zuletzt
+    genutzten _DIAGRAM_CACHE_SIZE Diagramme (LRU, thread-sicher).
+    """
+    key = (layout, repo_path, _fingerprint(data))
+    with _diagram_cache_lock:
+        diagram = _diagram_cache.get(key)
+        if diagram is not None:
+            _diagram_cache.move_to_end(key)
+            return diagram
+
+    # Außerhalb des Locks erzeugen; parallele Aufrufe rechnen im Zweifel doppelt
+    diagram = generate_diagram(data, layout, repo_path)
+    with _diagram_cache_lock:
+        _diagram_cache[key] = diagram
+        _diagram_cache.move_to_end(key)
+        while len(_diagram_cache) > _DIAGRAM_CACHE_SIZE:
+            _diagram_cache.popitem(last=False)
+    return diagram
+
+
+def _role_id(role_ids: dict[str, str], role_name: str) -> str:
+    """Node-ID einer Rolle aus der Tabelle; unbekannte Rollen werden nachgetragen."""
+    role_id = role_ids.get(role_name)
+    if role_id is None:
+        role_id = role_ids[role_name] = sanitize(f"role_{role_name}")
+    return role_id
 
 
 def _build_task_label(task: dict, base_label: str) -> str:
     """Baut ein erweitertes Label mit when-Info."""
-    parts = [base_label]
-
     when = task.get("when")
-    if when:
-        condition = " AND ".join(str(w) for w in when)
-        parts.append(f"fa:fa-question when: {escape_label(condition)}")
+    if not when:
+        return base_label
 
-    return "<br/>".join(parts)
+    condition = " AND ".join(str(w) for w in when)
+    return f"{base_label}<br/>fa:fa-question when: {escape_label(condition)}"
 
 
 def _add_tag_nodes(task: dict, owner_id: str, lines: list, nodes: DiagramNodes) -> None:
@@ -208,88 +316,133 @@ def _process_task(
     lines: list,
     nodes: DiagramNodes,
     connections: list,
-    task_counter: int
+    task_counter: int,
+    role_ids: dict[str, str] | None = None,
+    expanded_includes: set[int] | None = None
 ) -> int:
-    """Verarbeitet einen Task und fügt ihn zum Diagramm hinzu."""
-    task_name = task.get("name", f"task_{task_counter}")
-    task_id = f"{parent_id}_task_{task_counter}"
-    label = escape_label(task_name)
-
-    task_type = task.get("type", "task")
-
-    if task_type == "role":
-        role_name = task.get("role_name")
-        if role_name:
-            role_id = sanitize(f"role_{role_name}")
-            nodes.roles.add(role_id)
-            connections.append(f'    {parent_id} ==> {role_id}')
-        return task_counter + 1
-
-    if task_type == "include":
-        include_file = task.get("include_file", "")
-        include_id = sanitize(f"include_{os.path.basename(include_file)}")
-        nodes.includes.add(include_id)
-        lines.append(f'        {include_id}[/"{os.path.basename(include_file)}"/]')
-        lines.append(f'        {parent_id} --> {include_id}')
-
-        # Eingebundene Tasks verarbeiten
-        for included_task in task.get("included_tasks", []):
-            task_counter = _process_task(
-                included_task, include_id, lines, nodes, connections, task_counter + 1
-            )
-        return task_counter + 1
-
-    if task_type == "block":
-        block_id = f"{parent_id}_block_{task_counter}"
-        block_label = _build_task_label(task, label)
-        nodes.tasks.append(block_id)
-        lines.append(f'        {block_id}["{block_label}"]')
-        lines.append(f'        {parent_id} --> {block_id}')
-        _add_tag_nodes(task, block_id, lines, nodes)
-        _add_become_node(task, block_id, lines, nodes)
+    """Verarbeitet einen Task (inkl. Blocks/Includes) mit explizitem Stack.
+
+    Der Zähler läuft wie bei einer rekursiven Tiefensuche: +1 pro Task/Rolle,
+    +1 nach einem Block-Node, +1 vor jedem Include-Kind und beim Verlassen.
+    role_ids ist die Rollen-ID-Tabelle des Diagramms (wird bei Bedarf ergänzt),
+    expanded_includes die id() bereits expandierter Include-Listen.
+    """
+    if role_ids is None:
+        role_ids = {}
+    if expanded_includes is None:
+        expanded_includes = set()
+    # Einträge: (Task, Parent-ID) oder None als Zähler-Schritt
+    stack: list[tuple[dict, str] | None] = [(task, parent_id)]
+    while stack:
+        entry = stack.pop()
+        if entry is None:
+            task_counter += 1
+            continue
+        current, parent_id = entry
+
+        task_type = current.get("type", "task")
+
+        if task_type == "role":
+            role_name = current.get("role_name")
+            if role_name:
+                role_id = _role_id(role_ids, role_name)
+                nodes.roles.add(role_id)
+                connections.append(f'    {parent_id} ==> {role_id}')
+            task_counter += 1
+            continue
+
+        if task_type == "include":
+            include_name = os.path.basename(current.get("include_file", ""))
+            include_id = sanitize(f"include_{include_name}")
+            if current.get("cyclic"):
+                # Zyklus (vom Parser erkannt): gestrichelte Kante, keine Expansion
+                include_edge = f'        {parent_id} -.->|"cycle"| {include_id}'
+            else:
+                include_edge = f'        {parent_id} --> {include_id}'
+            included_tasks = current.get("included_tasks") or ()
+            # Der Parser teilt die Task-Liste identischer Includes: nur einmal expandieren
+            if included_tasks:
+                if id(included_tasks) in expanded_includes:
+                    lines.append(include_edge)
+                    task_counter += 1
+                    continue
+                expanded_includes.add(id(included_tasks))
+            nodes.includes.add(include_id)
+            lines.append(f'        {include_id}[/"{include_name}"/]')
+            lines.append(include_edge)
+
+            # Eingebundene Tasks: Schritt vor jedem Kind, ein Schritt beim Verlassen
+            stack.append(None)
+            for included_task in reversed(included_tasks):
+                stack.append((included_task, include_id))
+                stack.append(None)
+            continue
+
+        if task_type == "block":
+            block_id = f"{parent_id}_block_{task_counter}"
+            label = escape_label(current.get("name", f"task_{task_counter}"))
+            block_label = _build_task_label(current, label)
+            nodes.tasks.add(block_id)
+            lines.append(f'        {block_id}["{block_label}"]')
+            lines.append(f'        {parent_id} --> {block_id}')
+            _add_tag_nodes(current, block_id, lines, nodes)
+            _add_become_node(current, block_id, lines, nodes)
+            task_counter += 1
+            stack.extend((bt, block_id) for bt in reversed(current.get("block_tasks") or ()))
+            continue
+
+        # Normaler Task
+        _process_plain_task(current, parent_id, lines, nodes, connections, task_counter)
         task_counter += 1
-        for bt in task.get("block_tasks", []):
-            task_counter = _process_task(
-                bt, block_id, lines, nodes, connections, task_counter
-            )
-        return task_counter
 
-    # Normaler Task
+    return task_counter
+
+
+def _process_plain_task(
+    task: dict,
+    parent_id: str,
+    lines: list,
+    nodes: DiagramNodes,
+    connections: list,
+    task_counter: int
+) -> None:
+    """Verarbeitet einen normalen Task (kein Block/Include/Role); der Aufrufer zählt weiter."""
+    task_id = f"{parent_id}_task_{task_counter}"
+    label = escape_label(task.get("name", f"task_{task_counter}"))
     full_label = _build_task_label(task, label)
-    nodes.tasks.append(task_id)
+    nodes.tasks.add(task_id)
     lines.append(f'        {task_id}["{full_label}"]')
     lines.append(f'        {parent_id} --> {task_id}')
     _add_tag_nodes(task, task_id, lines, nodes)
     _add_become_node(task, task_id, lines, nodes)
 
     # Notify-Verbindungen
-    for handler_name in task.get("notify", []):
+    for handler_name in task.get("notify") or ():
         handler_id = sanitize(f"handler_{handler_name}")
-        if handler_id not in nodes.handlers:
-            nodes.handlers.add(handler_id)
+        if nodes.add("handlers", handler_id):
             lines.append(f'        {handler_id}(["fa:fa-bell {escape_label(handler_name)}"])')
         connections.append(f'    {task_id} -.->|"notifies"| {handler_id}')
 
-    return task_counter + 1
+
+def _emit_classes(ids: Iterable[str], class_name: str, lines: list) -> None:
+    """Schreibt class-Zeilen für eine Node-Menge, höchstens _CLASS_CHUNK IDs pro Zeile."""
+    it = iter(ids)
+    while chunk := list(islice(it, _CLASS_CHUNK)):
+        lines.append(f'    class {",".join(chunk)} {class_name}')
 
 
 def _apply_classes(lines: list, nodes: DiagramNodes) -> None:
-    """Wendet CSS-Klassen auf die Nodes an."""
-    if nodes.groups:
-        lines.append(f'    class {",".join(nodes.groups)} groupClass')
-    if nodes.hosts:
-        lines.append(f'    class {",".join(nodes.hosts)} hostClass')
-    if nodes.playbooks:
-        lines.append(f'    class {",".join(nodes.playbooks)} playbookClass')
-    if nodes.roles:
-        lines.append(f'    class {",".join(nodes.roles)} roleClass')
-    if nodes.tasks:
-        lines.append(f'    class {",".join(nodes.tasks)} taskClass')
-    if nodes.handlers:
-        lines.append(f'    class {",".join(nodes.handlers)} handlerClass')
-    if nodes.includes:
-        lines.append(f'    class {",".join(nodes.includes)} includeClass')
-    if nodes.tags:
-        lines.append(f'    class {",".join(nodes.tags)} tagClass')
-    if nodes.becomes:
-        lines.append(f'    class {",".join(nodes.becomes)} becomeClass')
+    """Wendet CSS-Klassen auf die Nodes an (sortiert, damit die Ausgabe stabil ist)."""
+    for items, class_name in (
+        (nodes.groups, "groupClass"),
+        (nodes.hosts, "hostClass"),
+        (nodes.playbooks, "playbookClass"),
+        (nodes.roles, "roleClass"),
+        (nodes.tasks, "taskClass"),
+        (nodes.handlers, "handlerClass"),
+        (nodes.includes, "includeClass"),
+        (nodes.tags, "tagClass"),
+        (nodes.becomes, "becomeClass"),
+    ):
+        if items:
+            _emit_classes(sorted(items), class_name, lines)
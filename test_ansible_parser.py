@@ -1,16 +1,19 @@
 """Tests für ansible_parser.py."""
 
 import os
-import tempfile
+import threading
 import pytest
 import yaml
 
+import ansible_parser
 from ansible_parser import (
     _collect_roles_from_tasks,
+    _load_yaml,
     _parse_yaml_group,
     extract_task_info,
     find_role_dependencies,
     find_role_tasks,
+    index_repo,
     load_included_tasks,
     parse_all,
     parse_ini_inventory,
@@ -18,21 +21,23 @@ from ansible_parser import (
     parse_playbook,
 )
 
+try:
+    from yaml import CSafeDumper as _YamlDumper
+except ImportError:  # PyYAML ohne libyaml
+    from yaml import SafeDumper as _YamlDumper
+
 
 @pytest.fixture
-def tmp_dir():
-    """Erstellt ein temporäres Verzeichnis und räumt es danach auf."""
-    d = tempfile.mkdtemp()
-    yield d
-    import shutil
-    shutil.rmtree(d)
+def tmp_dir(tmp_path):
+    """Temporäres Verzeichnis als String (pytest räumt alte Läufe selbst auf)."""
+    return str(tmp_path)
 
 
 def _write_yaml(path, data):
     """Hilfsfunktion: Schreibt YAML-Daten in eine Datei."""
     os.makedirs(os.path.dirname(path), exist_ok=True)
     with open(path, "w", encoding="utf-8") as f:
-        yaml.dump(data, f)
+        yaml.dump(data, f, Dumper=_YamlDumper)
 
 
 def _write_text(path, text):
@@ -42,6 +47,79 @@ def _write_text(path, text):
         f.write(text)
 
 
+@pytest.fixture(scope="session")
+def sample_repo(tmp_path_factory):
+    """Gemeinsames Beispiel-Repo mit Rollen für rein lesende Tests (einmal pro Session)."""
+    root = str(tmp_path_factory.mktemp("sample_repo"))
+    roles = os.path.join(root, "roles")
+    _write_yaml(os.path.join(roles, "nginx", "tasks", "main.yml"), [
+        {"name": "Install nginx", "apt": {"name": "nginx"}},
+        {"name": "Start nginx", "service": {"name": "nginx", "state": "started"}}
+    ])
+    _write_yaml(os.path.join(roles, "apache", "tasks", "main.yaml"), [
+        {"name": "Install apache"}
+    ])
+    _write_text(os.path.join(roles, "empty", "tasks", "main.yml"), "")
+    _write_yaml(os.path.join(roles, "broken", "tasks", "main.yml"), {"not": "a list"})
+    _write_yaml(os.path.join(roles, "broken", "meta", "main.yml"), ["not", "a", "dict"])
+    _write_yaml(os.path.join(roles, "webapp", "meta", "main.yml"), {
+        "dependencies": ["common", "nginx"]
+    })
+    _write_yaml(os.path.join(roles, "webapp_dict", "meta", "main.yml"), {
+        "dependencies": [
+            {"role": "common", "tags": ["base"]},
+            {"role": "nginx"}
+        ]
+    })
+    _write_yaml(os.path.join(roles, "app_named", "meta", "main.yml"), {
+        "dependencies": [{"name": "base_role"}]
+    })
+    _write_yaml(os.path.join(roles, "standalone", "meta", "main.yml"), {
+        "galaxy_info": {"author": "test"}
+    })
+    _write_yaml(os.path.join(roles, "app_yaml", "meta", "main.yaml"), {
+        "dependencies": ["base"]
+    })
+    _write_yaml(os.path.join(roles, "app_partial", "meta", "main.yml"), {
+        "dependencies": [
+            {"tags": ["base"]},
+            "valid_role"
+        ]
+    })
+    return root
+
+
+# ============================================================
+# _load_yaml
+# ============================================================
+
+class TestLoadYaml:
+    def test_parsed_once(self, tmp_dir):
+        path = os.path.join(tmp_dir, "data.yml")
+        _write_yaml(path, {"key": "value"})
+        first = _load_yaml(path)
+        assert first == {"key": "value"}
+        assert _load_yaml(path) is first
+
+    def test_reloads_on_change(self, tmp_dir):
+        path = os.path.join(tmp_dir, "data.yml")
+        _write_yaml(path, {"key": "value"})
+        _load_yaml(path)
+        _write_yaml(path, {"key": "changed", "other": 1})
+        assert _load_yaml(path) == {"key": "changed", "other": 1}
+
+    def test_relative_path_shares_cache(self, tmp_dir, monkeypatch):
+        path = os.path.join(tmp_dir, "data.yml")
+        _write_yaml(path, {"key": "value"})
+        first = _load_yaml(path)
+        monkeypatch.chdir(tmp_dir)
+        assert _load_yaml("data.yml") is first
+
+    def test_missing_file(self, tmp_dir):
+        with pytest.raises(OSError):
+            _load_yaml(os.path.join(tmp_dir, "missing.yml"))
+
+
 # ============================================================
 # _parse_yaml_group
 # ============================================================
@@ -75,6 +153,17 @@ class TestParseYamlGroup:
         assert groups["databases"] == []
         assert groups["mysql"] == ["db1"]
 
+    def test_children_keep_order(self):
+        groups = {}
+        content = {
+            "children": {
+                "a": {"children": {"a1": {}, "a2": {}}},
+                "b": {"hosts": {"b1": {}}}
+            }
+        }
+        _parse_yaml_group(groups, "all", content)
+        assert list(groups) == ["all", "a", "a1", "a2", "b"]
+
     def test_none_content(self):
         groups = {}
         _parse_yaml_group(groups, "empty", None)
@@ -155,6 +244,13 @@ class TestParseIniInventory:
         assert groups["empty_group"] == []
         assert groups["webservers"] == ["web1"]
 
+    def test_non_ascii_names_and_crlf(self, tmp_dir):
+        ini = "[wébserver]\r\nhöst1 ansible_host=10.0.0.1\r\n"
+        path = os.path.join(tmp_dir, "hosts")
+        _write_text(path, ini)
+        groups = parse_ini_inventory(path)
+        assert groups == {"wébserver": ["höst1"]}
+
 
 # ============================================================
 # parse_inventory (YAML + INI dispatch)
@@ -191,6 +287,21 @@ class TestParseInventory:
         groups = parse_inventory(path)
         assert groups["webservers"] == ["web1", "web2"]
 
+    def test_ini_skips_yaml_parse(self, tmp_dir, monkeypatch):
+        path = os.path.join(tmp_dir, "hosts")
+        _write_text(path, "# Produktion\n\n[webservers]\nweb1\n")
+
+        def _fail(_path):
+            raise AssertionError("YAML-Parser sollte nicht aufgerufen werden")
+
+        monkeypatch.setattr(ansible_parser, "_load_yaml", _fail)
+        assert parse_inventory(path) == {"webservers": ["web1"]}
+
+    def test_ini_without_section_header_fallback(self, tmp_dir):
+        path = os.path.join(tmp_dir, "hosts")
+        _write_text(path, "web1\n[databases]\ndb1\n")
+        assert parse_inventory(path) == {"databases": ["db1"]}
+
     def test_yaml_empty_inventory(self, tmp_dir):
         path = os.path.join(tmp_dir, "empty.yml")
         _write_text(path, "")
@@ -212,28 +323,28 @@ class TestParseInventory:
 class TestExtractTaskInfo:
     def test_simple_task(self):
         task = {"name": "Install nginx", "apt": {"name": "nginx"}}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["name"] == "Install nginx"
         assert info["type"] == "task"
 
     def test_unnamed_task(self):
         task = {"debug": {"msg": "hello"}}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["name"] == "unnamed_task"
 
     def test_notify_string(self):
         task = {"name": "Install", "apt": {"name": "nginx"}, "notify": "Restart nginx"}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["notify"] == ["Restart nginx"]
 
     def test_notify_list(self):
         task = {"name": "Install", "apt": {"name": "nginx"}, "notify": ["Restart nginx", "Reload config"]}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["notify"] == ["Restart nginx", "Reload config"]
 
     def test_no_notify(self):
         task = {"name": "Simple task", "debug": {"msg": "hi"}}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert "notify" not in info
 
     def test_block_with_rescue_and_always(self):
@@ -250,7 +361,7 @@ class TestExtractTaskInfo:
                 {"name": "Cleanup", "command": "cleanup"}
             ]
         }
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["type"] == "block"
         assert len(info["block_tasks"]) == 4
         names = [t["name"] for t in info["block_tasks"]]
@@ -263,7 +374,7 @@ class TestExtractTaskInfo:
                 {"name": "Task 1", "command": "cmd1"}
             ]
         }
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["type"] == "block"
         assert len(info["block_tasks"]) == 1
 
@@ -275,19 +386,19 @@ class TestExtractTaskInfo:
                 {"name": "Step 1", "command": "cmd"}
             ]
         }
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["type"] == "block"
         assert info["notify"] == ["Restart service"]
 
     def test_include_role(self):
         task = {"name": "Apply role", "include_role": {"name": "nginx"}}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["type"] == "role"
         assert info["role_name"] == "nginx"
 
     def test_import_role(self):
         task = {"name": "Import role", "import_role": {"name": "common"}}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["type"] == "role"
         assert info["role_name"] == "common"
 
@@ -296,7 +407,7 @@ class TestExtractTaskInfo:
         _write_yaml(tasks_file, [{"name": "Included task", "debug": {"msg": "hi"}}])
 
         task = {"name": "Include extra", "include_tasks": "extra_tasks.yml"}
-        info = extract_task_info(task, tmp_dir, os.path.join(tmp_dir, "pb.yml"))
+        info = extract_task_info(task, tmp_dir, tmp_dir)
         assert info["type"] == "include"
         assert info["include_file"] == "extra_tasks.yml"
         assert len(info["included_tasks"]) == 1
@@ -307,7 +418,7 @@ class TestExtractTaskInfo:
         _write_yaml(tasks_file, [{"name": "Imported task", "command": "ls"}])
 
         task = {"name": "Import extra", "import_tasks": "imported.yml"}
-        info = extract_task_info(task, tmp_dir, os.path.join(tmp_dir, "pb.yml"))
+        info = extract_task_info(task, tmp_dir, tmp_dir)
         assert info["type"] == "include"
         assert info["include_file"] == "imported.yml"
         assert len(info["included_tasks"]) == 1
@@ -317,10 +428,49 @@ class TestExtractTaskInfo:
         _write_yaml(tasks_file, [{"name": "Task", "debug": {"msg": "ok"}}])
 
         task = {"name": "Include dict", "include_tasks": {"file": "extra.yml"}}
-        info = extract_task_info(task, tmp_dir, os.path.join(tmp_dir, "pb.yml"))
+        info = extract_task_info(task, tmp_dir, tmp_dir)
         assert info["type"] == "include"
         assert info["include_file"] == "extra.yml"
 
+    def test_shared_include_expanded_once(self, tmp_dir):
+        _write_yaml(os.path.join(tmp_dir, "shared.yml"), [{"name": "Shared", "command": "cmd"}])
+        task = {"name": "Include shared", "include_tasks": "shared.yml"}
+        include_cache = {}
+        first = extract_task_info(task, tmp_dir, tmp_dir, include_cache)
+        second = extract_task_info(task, tmp_dir, tmp_dir, include_cache)
+        assert first["included_tasks"] is second["included_tasks"]
+
+    def test_include_cache_scoped_to_call(self, tmp_dir):
+        _write_yaml(os.path.join(tmp_dir, "shared.yml"), [{"name": "Shared", "command": "cmd"}])
+        task = {"name": "Include shared", "include_tasks": "shared.yml"}
+        first = extract_task_info(task, tmp_dir, tmp_dir)
+        second = extract_task_info(task, tmp_dir, tmp_dir)
+        assert first["included_tasks"] is not second["included_tasks"]
+        assert first["included_tasks"] == second["included_tasks"]
+
+    def test_include_loads_resolved_file(self, tmp_dir):
+        pb_dir = os.path.join(tmp_dir, "pb")
+        _write_text(os.path.join(pb_dir, "t.yml"), "")
+        _write_yaml(os.path.join(tmp_dir, "t.yml"), [{"name": "Root task", "command": "x"}])
+        task = {"name": "Include t", "include_tasks": "t.yml"}
+        include_cache = {}
+        info = extract_task_info(task, tmp_dir, pb_dir, include_cache)
+        # pb/t.yml existiert (leer) und ist Key wie Quelle; kein Rückfall auf den Repo-Root
+        assert info["included_tasks"] == []
+        assert list(include_cache) == [(tmp_dir, pb_dir, os.path.realpath(os.path.join(pb_dir, "t.yml")))]
+
+    def test_cyclic_include(self, tmp_dir):
+        _write_yaml(os.path.join(tmp_dir, "loop.yml"), [
+            {"name": "Again", "include_tasks": "loop.yml"}
+        ])
+        task = {"name": "Start", "include_tasks": "loop.yml"}
+        info = extract_task_info(task, tmp_dir, tmp_dir)
+        inner = info["included_tasks"][0]
+        assert inner["name"] == "Again"
+        assert inner["included_tasks"] == []
+        assert inner["cyclic"] is True
+        assert "cyclic" not in info
+
     def test_nested_block_in_block(self):
         task = {
             "name": "Outer block",
@@ -333,7 +483,7 @@ class TestExtractTaskInfo:
                 }
             ]
         }
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["type"] == "block"
         assert len(info["block_tasks"]) == 1
         inner = info["block_tasks"][0]
@@ -341,51 +491,63 @@ class TestExtractTaskInfo:
         assert len(inner["block_tasks"]) == 1
         assert inner["block_tasks"][0]["name"] == "Deep task"
 
+    def test_deeply_nested_blocks(self):
+        task = {"name": "Leaf", "command": "cmd"}
+        for i in range(3000):
+            task = {"name": f"Level {i}", "block": [task]}
+        info = extract_task_info(task, "/tmp", "/tmp")
+        depth = 0
+        while info["type"] == "block":
+            info = info["block_tasks"][0]
+            depth += 1
+        assert depth == 3000
+        assert info["name"] == "Leaf"
+
     def test_when_string(self):
         task = {"name": "Conditional", "debug": {"msg": "hi"}, "when": "ansible_os_family == 'Debian'"}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["when"] == ["ansible_os_family == 'Debian'"]
 
     def test_when_list(self):
         task = {"name": "Multi when", "debug": {"msg": "hi"}, "when": ["condition_a", "condition_b"]}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["when"] == ["condition_a", "condition_b"]
 
     def test_no_when(self):
         task = {"name": "No when", "debug": {"msg": "hi"}}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert "when" not in info
 
     def test_tags_string(self):
         task = {"name": "Tagged", "debug": {"msg": "hi"}, "tags": "deploy"}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["tags"] == ["deploy"]
 
     def test_tags_list(self):
         task = {"name": "Multi tags", "debug": {"msg": "hi"}, "tags": ["deploy", "web"]}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["tags"] == ["deploy", "web"]
 
     def test_no_tags(self):
         task = {"name": "No tags", "debug": {"msg": "hi"}}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert "tags" not in info
 
     def test_become_true(self):
         task = {"name": "Privileged", "apt": {"name": "nginx"}, "become": True}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["become"] is True
         assert "become_user" not in info
 
     def test_become_with_user(self):
         task = {"name": "As postgres", "command": "psql", "become": True, "become_user": "postgres"}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["become"] is True
         assert info["become_user"] == "postgres"
 
     def test_become_false(self):
         task = {"name": "No become", "debug": {"msg": "hi"}, "become": False}
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert "become" not in info
 
     def test_all_attributes_combined(self):
@@ -398,7 +560,7 @@ class TestExtractTaskInfo:
             "become_user": "root",
             "notify": "Restart nginx"
         }
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["when"] == ["ansible_os_family == 'Debian'"]
         assert info["tags"] == ["deploy", "web"]
         assert info["become"] is True
@@ -411,7 +573,7 @@ class TestExtractTaskInfo:
             "when": "install_nginx",
             "block": [{"name": "Install", "apt": {"name": "nginx"}}]
         }
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["type"] == "block"
         assert info["when"] == ["install_nginx"]
 
@@ -421,7 +583,7 @@ class TestExtractTaskInfo:
             "tags": ["setup"],
             "block": [{"name": "Step", "command": "cmd"}]
         }
-        info = extract_task_info(task, "/tmp", "/tmp/pb.yml")
+        info = extract_task_info(task, "/tmp", "/tmp")
         assert info["type"] == "block"
         assert info["tags"] == ["setup"]
 
@@ -437,7 +599,7 @@ class TestLoadIncludedTasks:
         tasks_file = os.path.join(subdir, "extra.yml")
         _write_yaml(tasks_file, [{"name": "Relative task", "debug": {"msg": "ok"}}])
 
-        result = load_included_tasks(tmp_dir, "extra.yml", os.path.join(subdir, "main.yml"))
+        result = load_included_tasks(tmp_dir, "extra.yml", subdir)
         assert len(result) == 1
         assert result[0]["name"] == "Relative task"
 
@@ -445,148 +607,200 @@ class TestLoadIncludedTasks:
         tasks_file = os.path.join(tmp_dir, "shared_tasks.yml")
         _write_yaml(tasks_file, [{"name": "Repo task", "command": "cmd"}])
 
-        result = load_included_tasks(tmp_dir, "shared_tasks.yml", "/other/path/pb.yml")
+        result = load_included_tasks(tmp_dir, "shared_tasks.yml", "/other/path")
         assert len(result) == 1
 
     def test_missing_file(self, tmp_dir):
-        result = load_included_tasks(tmp_dir, "nonexistent.yml", "/tmp/pb.yml")
+        result = load_included_tasks(tmp_dir, "nonexistent.yml", "/tmp")
         assert result == []
 
     def test_empty_task_file(self):
-        result = load_included_tasks("/tmp", "", "/tmp/pb.yml")
+        result = load_included_tasks("/tmp", "", "/tmp")
         assert result == []
 
     def test_invalid_yaml(self, tmp_dir):
         bad_file = os.path.join(tmp_dir, "bad.yml")
         _write_text(bad_file, ": : : invalid yaml [[[")
-        result = load_included_tasks(tmp_dir, "bad.yml", os.path.join(tmp_dir, "pb.yml"))
+        result = load_included_tasks(tmp_dir, "bad.yml", tmp_dir)
         assert result == []
 
     def test_non_list_yaml(self, tmp_dir):
         tasks_file = os.path.join(tmp_dir, "dict_tasks.yml")
         _write_yaml(tasks_file, {"not": "a list"})
-        result = load_included_tasks(tmp_dir, "dict_tasks.yml", os.path.join(tmp_dir, "pb.yml"))
+        result = load_included_tasks(tmp_dir, "dict_tasks.yml", tmp_dir)
         assert result == []
 
 
+# ============================================================
+# index_repo
+# ============================================================
+
+class TestIndexRepo:
+    def test_top_level_roles(self, tmp_dir):
+        os.makedirs(os.path.join(tmp_dir, "roles", "nginx", "tasks"))
+        os.makedirs(os.path.join(tmp_dir, "roles", "common"))
+        index = index_repo(tmp_dir).roles
+        assert index == {
+            "nginx": os.path.join(tmp_dir, "roles", "nginx"),
+            "common": os.path.join(tmp_dir, "roles", "common"),
+        }
+
+    def test_nested_roles_dir(self, tmp_dir):
+        os.makedirs(os.path.join(tmp_dir, "ansible", "roles", "app"))
+        index = index_repo(tmp_dir).roles
+        assert index["app"] == os.path.join(tmp_dir, "ansible", "roles", "app")
+
+    def test_hidden_dirs_skipped(self, tmp_dir):
+        os.makedirs(os.path.join(tmp_dir, ".git", "roles", "hidden"))
+        assert index_repo(tmp_dir).roles == {}
+
+    def test_role_contents_not_walked(self, tmp_dir, monkeypatch):
+        for sub in ("files", "templates", "molecule"):
+            os.makedirs(os.path.join(tmp_dir, "roles", "app", sub, "roles", "ghost"))
+        visited = []
+        real_walk = os.walk
+
+        def _recording_walk(top, *args, **kwargs):
+            for entry in real_walk(top, *args, **kwargs):
+                visited.append(entry[0])
+                yield entry
+
+        monkeypatch.setattr(os, "walk", _recording_walk)
+        assert index_repo(tmp_dir).roles == {"app": os.path.join(tmp_dir, "roles", "app")}
+        assert visited == [tmp_dir, os.path.join(tmp_dir, "roles")]
+
+    def test_symlinked_role(self, tmp_dir):
+        os.makedirs(os.path.join(tmp_dir, "shared", "base", "tasks"))
+        os.makedirs(os.path.join(tmp_dir, "roles"))
+        os.symlink(os.path.join(tmp_dir, "shared", "base"), os.path.join(tmp_dir, "roles", "base"))
+        assert index_repo(tmp_dir).roles["base"] == os.path.join(tmp_dir, "roles", "base")
+
+    def test_missing_repo(self, tmp_dir):
+        assert index_repo(os.path.join(tmp_dir, "missing")).roles == {}
+
+    def test_root_named_roles(self, tmp_dir):
+        root = os.path.join(tmp_dir, "roles")
+        _write_text(os.path.join(root, "inventory", "hosts"), "[web]\nweb1\n")
+        _write_text(os.path.join(root, "playbooks", "site.yml"), "- hosts: all\n")
+        os.makedirs(os.path.join(root, "roles", "nginx", "tasks"))
+        for path in (root, root + os.sep):
+            index = index_repo(path)
+            assert [os.path.relpath(p, path) for p in index.inventories] == [
+                os.path.join("inventory", "hosts")
+            ]
+            assert [os.path.relpath(p, path) for p in index.playbook_candidates] == [
+                os.path.join("playbooks", "site.yml")
+            ]
+            assert list(index.roles) == ["nginx"]
+
+    def test_symlinked_inventory_and_playbook_dirs(self, tmp_dir):
+        _write_text(os.path.join(tmp_dir, "shared", "inv", "hosts"), "[web]\nweb1\n")
+        _write_text(os.path.join(tmp_dir, "shared", "pbs", "site.yml"), "- hosts: all\n")
+        os.symlink(os.path.join(tmp_dir, "shared", "inv"), os.path.join(tmp_dir, "inventory"))
+        os.symlink(os.path.join(tmp_dir, "shared", "pbs"), os.path.join(tmp_dir, "playbooks"))
+        index = index_repo(tmp_dir)
+        assert index.inventories == [os.path.join(tmp_dir, "inventory", "hosts")]
+        assert index.playbook_candidates == [os.path.join(tmp_dir, "playbooks", "site.yml")]
+
+    def test_symlink_cycles_terminate(self, tmp_dir):
+        _write_text(os.path.join(tmp_dir, "a", "inventory", "hosts"), "[web]\nweb1\n")
+        os.makedirs(os.path.join(tmp_dir, "b"))
+        os.symlink(tmp_dir, os.path.join(tmp_dir, "a", "to_root"))
+        os.symlink(os.path.join(tmp_dir, "b"), os.path.join(tmp_dir, "a", "to_b"))
+        os.symlink(os.path.join(tmp_dir, "a"), os.path.join(tmp_dir, "b", "to_a"))
+        inventories = index_repo(tmp_dir).inventories
+        assert os.path.join(tmp_dir, "a", "inventory", "hosts") in inventories
+        assert len(inventories) <= 2
+
+    def test_inventories(self, tmp_dir):
+        _write_text(os.path.join(tmp_dir, "hosts.ini"), "[web]\nweb1\n")
+        _write_text(os.path.join(tmp_dir, "inventories", "prod", "hosts"), "[db]\ndb1\n")
+        _write_text(os.path.join(tmp_dir, "inventories", "prod", "group_vars", "all.yml"), "a: 1\n")
+        _write_text(os.path.join(tmp_dir, "sub", "hosts"), "[x]\nx1\n")
+        assert index_repo(tmp_dir).inventories == [
+            os.path.join(tmp_dir, "hosts.ini"),
+            os.path.join(tmp_dir, "inventories", "prod", "hosts"),
+        ]
+
+    def test_playbook_candidates(self, tmp_dir):
+        _write_text(os.path.join(tmp_dir, "site.yml"), "- hosts: all\n")
+        _write_text(os.path.join(tmp_dir, "playbooks", "web.yaml"), "- hosts: web\n")
+        _write_text(os.path.join(tmp_dir, "playbooks", "notes.txt"), "x\n")
+        _write_text(os.path.join(tmp_dir, "roles", "app", "playbooks", "x.yml"), "- hosts: all\n")
+        _write_text(os.path.join(tmp_dir, "vars", "main.yml"), "a: 1\n")
+        assert index_repo(tmp_dir).playbook_candidates == [
+            os.path.join(tmp_dir, "playbooks", "web.yaml"),
+            os.path.join(tmp_dir, "site.yml"),
+        ]
+
+
 # ============================================================
 # find_role_tasks
 # ============================================================
 
 class TestFindRoleTasks:
-    def test_finds_tasks(self, tmp_dir):
-        tasks_dir = os.path.join(tmp_dir, "roles", "nginx", "tasks")
-        os.makedirs(tasks_dir)
-        _write_yaml(os.path.join(tasks_dir, "main.yml"), [
-            {"name": "Install nginx", "apt": {"name": "nginx"}},
-            {"name": "Start nginx", "service": {"name": "nginx", "state": "started"}}
-        ])
-        tasks = find_role_tasks(tmp_dir, "nginx")
+    def test_finds_tasks(self, sample_repo):
+        tasks = find_role_tasks(sample_repo, "nginx")
         assert len(tasks) == 2
         assert tasks[0]["name"] == "Install nginx"
 
-    def test_yaml_extension(self, tmp_dir):
-        tasks_dir = os.path.join(tmp_dir, "roles", "apache", "tasks")
-        os.makedirs(tasks_dir)
-        _write_yaml(os.path.join(tasks_dir, "main.yaml"), [
-            {"name": "Install apache"}
-        ])
-        tasks = find_role_tasks(tmp_dir, "apache")
+    def test_yaml_extension(self, sample_repo):
+        tasks = find_role_tasks(sample_repo, "apache")
         assert len(tasks) == 1
 
-    def test_role_not_found(self, tmp_dir):
-        tasks = find_role_tasks(tmp_dir, "nonexistent")
+    def test_role_not_found(self, sample_repo):
+        tasks = find_role_tasks(sample_repo, "nonexistent")
         assert tasks == []
 
-    def test_empty_tasks_file(self, tmp_dir):
-        tasks_dir = os.path.join(tmp_dir, "roles", "empty", "tasks")
-        os.makedirs(tasks_dir)
-        _write_text(os.path.join(tasks_dir, "main.yml"), "")
-        tasks = find_role_tasks(tmp_dir, "empty")
+    def test_empty_tasks_file(self, sample_repo):
+        tasks = find_role_tasks(sample_repo, "empty")
         assert tasks == []
 
-    def test_non_list_yaml(self, tmp_dir):
-        tasks_dir = os.path.join(tmp_dir, "roles", "broken", "tasks")
-        os.makedirs(tasks_dir)
-        _write_yaml(os.path.join(tasks_dir, "main.yml"), {"not": "a list"})
-        tasks = find_role_tasks(tmp_dir, "broken")
+    def test_non_list_yaml(self, sample_repo):
+        tasks = find_role_tasks(sample_repo, "broken")
         assert tasks == []
 
+    def test_uses_given_role_dirs(self, sample_repo):
+        role_dirs = {"alias": os.path.join(sample_repo, "roles", "nginx")}
+        assert find_role_tasks(sample_repo, "alias", role_dirs) == find_role_tasks(sample_repo, "nginx")
+        assert find_role_tasks(sample_repo, "nginx", role_dirs) == []
+
 
 # ============================================================
 # find_role_dependencies
 # ============================================================
 
 class TestFindRoleDependencies:
-    def test_string_dependencies(self, tmp_dir):
-        meta_dir = os.path.join(tmp_dir, "roles", "webapp", "meta")
-        os.makedirs(meta_dir)
-        _write_yaml(os.path.join(meta_dir, "main.yml"), {
-            "dependencies": ["common", "nginx"]
-        })
-        deps = find_role_dependencies(tmp_dir, "webapp")
+    def test_string_dependencies(self, sample_repo):
+        deps = find_role_dependencies(sample_repo, "webapp")
         assert deps == ["common", "nginx"]
 
-    def test_dict_dependencies_role_key(self, tmp_dir):
-        meta_dir = os.path.join(tmp_dir, "roles", "webapp", "meta")
-        os.makedirs(meta_dir)
-        _write_yaml(os.path.join(meta_dir, "main.yml"), {
-            "dependencies": [
-                {"role": "common", "tags": ["base"]},
-                {"role": "nginx"}
-            ]
-        })
-        deps = find_role_dependencies(tmp_dir, "webapp")
+    def test_dict_dependencies_role_key(self, sample_repo):
+        deps = find_role_dependencies(sample_repo, "webapp_dict")
         assert deps == ["common", "nginx"]
 
-    def test_dict_dependencies_name_key(self, tmp_dir):
-        meta_dir = os.path.join(tmp_dir, "roles", "app", "meta")
-        os.makedirs(meta_dir)
-        _write_yaml(os.path.join(meta_dir, "main.yml"), {
-            "dependencies": [{"name": "base_role"}]
-        })
-        deps = find_role_dependencies(tmp_dir, "app")
+    def test_dict_dependencies_name_key(self, sample_repo):
+        deps = find_role_dependencies(sample_repo, "app_named")
         assert deps == ["base_role"]
 
-    def test_no_dependencies(self, tmp_dir):
-        meta_dir = os.path.join(tmp_dir, "roles", "standalone", "meta")
-        os.makedirs(meta_dir)
-        _write_yaml(os.path.join(meta_dir, "main.yml"), {
-            "galaxy_info": {"author": "test"}
-        })
-        deps = find_role_dependencies(tmp_dir, "standalone")
+    def test_no_dependencies(self, sample_repo):
+        deps = find_role_dependencies(sample_repo, "standalone")
         assert deps == []
 
-    def test_no_meta_file(self, tmp_dir):
-        deps = find_role_dependencies(tmp_dir, "nonexistent")
+    def test_no_meta_file(self, sample_repo):
+        deps = find_role_dependencies(sample_repo, "nonexistent")
         assert deps == []
 
-    def test_yaml_extension(self, tmp_dir):
-        meta_dir = os.path.join(tmp_dir, "roles", "app", "meta")
-        os.makedirs(meta_dir)
-        _write_yaml(os.path.join(meta_dir, "main.yaml"), {
-            "dependencies": ["base"]
-        })
-        deps = find_role_dependencies(tmp_dir, "app")
+    def test_yaml_extension(self, sample_repo):
+        deps = find_role_dependencies(sample_repo, "app_yaml")
         assert deps == ["base"]
 
-    def test_non_dict_yaml(self, tmp_dir):
-        meta_dir = os.path.join(tmp_dir, "roles", "broken", "meta")
-        os.makedirs(meta_dir)
-        _write_yaml(os.path.join(meta_dir, "main.yml"), ["not", "a", "dict"])
-        deps = find_role_dependencies(tmp_dir, "broken")
+    def test_non_dict_yaml(self, sample_repo):
+        deps = find_role_dependencies(sample_repo, "broken")
         assert deps == []
 
-    def test_dep_dict_without_name_or_role(self, tmp_dir):
-        meta_dir = os.path.join(tmp_dir, "roles", "app", "meta")
-        os.makedirs(meta_dir)
-        _write_yaml(os.path.join(meta_dir, "main.yml"), {
-            "dependencies": [
-                {"tags": ["base"]},
-                "valid_role"
-            ]
-        })
-        deps = find_role_dependencies(tmp_dir, "app")
+    def test_dep_dict_without_name_or_role(self, sample_repo):
+        deps = find_role_dependencies(sample_repo, "app_partial")
         assert deps == ["valid_role"]
 
 
@@ -639,6 +853,17 @@ class TestParsePlaybook:
         task_names = [t["name"] for t in result["plays"][0]["tasks"]]
         assert task_names == ["Pre task", "Main task", "Post task"]
 
+    def test_has_role_tasks_flag(self, tmp_dir):
+        pb = [
+            {"hosts": "all", "tasks": [{"name": "Flat", "debug": {"msg": "x"}}]},
+            {"hosts": "all", "tasks": [{"name": "Role", "include_role": {"name": "nginx"}}]},
+        ]
+        path = os.path.join(tmp_dir, "pb.yml")
+        _write_yaml(path, pb)
+        result = parse_playbook(path, tmp_dir)
+        assert "has_role_tasks" not in result["plays"][0]
+        assert result["plays"][1]["has_role_tasks"] is True
+
     def test_handlers(self, tmp_dir):
         pb = [{
             "hosts": "all",
@@ -831,12 +1056,53 @@ class TestCollectRolesFromTasks:
         _collect_roles_from_tasks([], roles)
         assert roles == set()
 
+    def test_cyclic_task_graph_terminates(self):
+        loop = []
+        loop.append({"type": "include", "name": "Again", "included_tasks": loop})
+        loop.append({"type": "role", "role_name": "looped", "name": "Apply"})
+        roles = set()
+        _collect_roles_from_tasks(loop, roles)
+        assert roles == {"looped"}
+
 
 # ============================================================
 # parse_all (Integration)
 # ============================================================
 
 class TestParseAll:
+    def test_concurrent_mutual_includes(self, tmp_dir, monkeypatch):
+        # x.yml und y.yml binden sich gegenseitig ein; mehrere Playbooks werden
+        # gleichzeitig geparst und dürfen keine halb expandierten Listen teilen
+        _write_yaml(os.path.join(tmp_dir, "x.yml"), [
+            {"name": "To y", "include_tasks": "y.yml"},
+            {"name": "Apply x", "include_role": {"name": "role_x"}},
+        ])
+        _write_yaml(os.path.join(tmp_dir, "y.yml"), [
+            {"name": "To x", "include_tasks": "x.yml"},
+            {"name": "Apply y", "include_role": {"name": "role_y"}},
+        ])
+        playbooks = []
+        for i in range(8):
+            path = os.path.join(tmp_dir, f"pb{i}.yml")
+            first = "x.yml" if i % 2 else "y.yml"
+            _write_yaml(path, [{"hosts": "all", "tasks": [{"include_tasks": first}]}])
+            playbooks.append(path)
+        monkeypatch.setattr(os, "cpu_count", lambda: 4)
+
+        result = {}
+        worker = threading.Thread(
+            target=lambda: result.update(data=parse_all([], playbooks, tmp_dir)),
+            daemon=True,
+        )
+        worker.start()
+        worker.join(timeout=30)
+        assert not worker.is_alive(), "parse_all hängt bei zyklischen Includes"
+        assert result["data"].roles == {"role_x", "role_y"}
+        for pb_data in result["data"].playbooks.values():
+            outer = pb_data["plays"][0]["tasks"][0]
+            inner = outer["included_tasks"][0]
+            assert inner["included_tasks"][0]["cyclic"] is True
+
     def _setup_repo(self, tmp_dir):
         """Erstellt eine vollständige Ansible-Repo-Struktur."""
         # Inventory
@@ -974,3 +1240,55 @@ class TestParseAll:
         # shared.yml sollte nur einmal vorkommen
         shared_count = sum(1 for pb in data.playbooks.values() if pb["name"] == "shared.yml")
         assert shared_count == 1
+
+    def test_symlinked_playbook_parsed_once(self, tmp_dir):
+        pb_dir = os.path.join(tmp_dir, "playbooks")
+        os.makedirs(pb_dir)
+        _write_yaml(os.path.join(pb_dir, "shared.yml"), [
+            {"hosts": "all", "tasks": [{"name": "Shared", "debug": {"msg": "shared"}}]}
+        ])
+        os.symlink(os.path.join(pb_dir, "shared.yml"), os.path.join(pb_dir, "alias.yml"))
+        _write_yaml(os.path.join(pb_dir, "site.yml"), [
+            {"import_playbook": "shared.yml"},
+            {"import_playbook": "./alias.yml"}
+        ])
+
+        data = parse_all([], [os.path.join(pb_dir, "site.yml")], tmp_dir)
+        assert len(data.playbooks) == 2
+        assert os.path.realpath(os.path.join(pb_dir, "shared.yml")) in data.playbooks
+
+    def test_runs_do_not_share_mutable_results(self, tmp_dir):
+        paths = self._setup_repo(tmp_dir)
+        _write_yaml(paths["pb"], [{
+            "hosts": "webservers",
+            "roles": ["nginx"],
+            "tasks": [{"name": "Tagged", "debug": {"msg": "x"}, "when": ["a"], "tags": ["t"]}],
+        }])
+        first = parse_all([], [paths["pb"]], tmp_dir)
+        first.role_tasks["nginx"].append({"name": "Injected"})
+        first.role_tasks["nginx"][0]["name"] = "Renamed"
+        task = next(iter(first.playbooks.values()))["plays"][0]["tasks"][0]
+        task["when"].append("b")
+        task["tags"].append("u")
+
+        second = parse_all([], [paths["pb"]], tmp_dir)
+        assert second.role_tasks["nginx"] is not first.role_tasks["nginx"]
+        assert [t["name"] for t in second.role_tasks["nginx"]] == ["Task for nginx"]
+        task = next(iter(second.playbooks.values()))["plays"][0]["tasks"][0]
+        assert task["when"] == ["a"]
+        assert task["tags"] == ["t"]
+
+    def test_caches_reset_between_runs(self, tmp_dir):
+        paths = self._setup_repo(tmp_dir)
+        parse_all([paths["inv"]], [paths["pb"]], tmp_dir)
+
+        # Neue Rolle nach dem ersten Lauf anlegen und als Dependency eintragen
+        _write_yaml(os.path.join(tmp_dir, "roles", "extra", "tasks", "main.yml"), [
+            {"name": "Extra task", "debug": {"msg": "extra"}}
+        ])
+        _write_yaml(os.path.join(tmp_dir, "roles", "common", "meta", "main.yml"), {
+            "dependencies": ["extra"]
+        })
+        data = parse_all([paths["inv"]], [paths["pb"]], tmp_dir)
+        assert data.role_dependencies["common"] == ["extra"]
+        assert len(data.role_tasks["extra"]) == 1
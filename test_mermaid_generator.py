@@ -1,5 +1,8 @@
 """Tests für mermaid_generator.py."""
 
+import pytest
+
+import mermaid_generator
 from ansible_parser import AnsibleData
 from mermaid_generator import (
     DiagramNodes,
@@ -10,6 +13,8 @@ from mermaid_generator import (
     _process_task,
     escape_label,
     generate_diagram,
+    generate_diagram_cached,
+    iter_diagram,
     sanitize,
 )
 
@@ -37,6 +42,10 @@ class TestSanitize:
     def test_leading_digit_with_special(self):
         assert sanitize("1.2.3.4") == "id_1_2_3_4"
 
+    def test_leading_superscript_not_a_digit(self):
+        # Wie \d: nur Dezimalziffern zählen, "²" ist ein Wortzeichen
+        assert sanitize("²host") == "²host"
+
     def test_whitespace_stripped(self):
         assert sanitize("  hello  ") == "hello"
 
@@ -68,34 +77,47 @@ class TestEscapeLabel:
     def test_empty_string(self):
         assert escape_label("") == ""
 
+    def test_non_string_with_quotes(self):
+        assert escape_label(['a"b']) == "['a'b']"
+
 
 # ============================================================
 # _process_task
 # ============================================================
 
-class TestProcessTask:
-    def _run(self, task, parent_id="pb"):
-        lines = []
-        nodes = DiagramNodes()
-        connections = []
-        counter = _process_task(task, parent_id, lines, nodes, connections, 0)
-        return lines, nodes, connections, counter
+@pytest.fixture
+def emit_ctx():
+    """Frische Sammler (lines, nodes, connections) für _process_task."""
+    return [], DiagramNodes(), []
 
-    def test_simple_task(self):
-        task = {"name": "Install nginx", "type": "task"}
-        lines, nodes, connections, counter = self._run(task)
-        assert counter == 1
-        assert any("Install nginx" in line for line in lines)
-        assert len(nodes.tasks) == 1
 
-    def test_role_task(self):
-        task = {"name": "Apply nginx", "type": "role", "role_name": "nginx"}
-        lines, nodes, connections, counter = self._run(task)
+class TestProcessTask:
+    @pytest.mark.parametrize("task, kind, node_ids, expected_lines, expected_connections", [
+        ({"name": "Install nginx", "type": "task"},
+         "tasks", {"pb_task_0"},
+         ['        pb_task_0["Install nginx"]', "        pb --> pb_task_0"],
+         []),
+        ({"name": "Apply nginx", "type": "role", "role_name": "nginx"},
+         "roles", {"role_nginx"}, [], ["    pb ==> role_nginx"]),
+        ({"name": "Unnamed role", "type": "role"},
+         "roles", set(), [], []),
+        ({"name": "Install pkg", "type": "task", "notify": ["Restart service"]},
+         "handlers", {"handler_Restart_service"},
+         ['        pb_task_0["Install pkg"]', "        pb --> pb_task_0",
+          '        handler_Restart_service(["fa:fa-bell Restart service"])'],
+         ['    pb_task_0 -.->|"notifies"| handler_Restart_service']),
+    ], ids=["task", "role", "role_without_name", "notify"])
+    def test_single_task(
+        self, emit_ctx, task, kind, node_ids, expected_lines, expected_connections
+    ):
+        lines, nodes, connections = emit_ctx
+        counter = _process_task(task, "pb", lines, nodes, connections, 0)
         assert counter == 1
-        assert sanitize("role_nginx") in nodes.roles
-        assert any("==>" in c for c in connections)
+        assert getattr(nodes, kind) == node_ids
+        assert lines == expected_lines
+        assert connections == expected_connections
 
-    def test_include_task(self):
+    def test_include_task(self, emit_ctx):
         task = {
             "name": "Include extra",
             "type": "include",
@@ -105,11 +127,12 @@ class TestProcessTask:
                 {"name": "Subtask 2", "type": "task"}
             ]
         }
-        lines, nodes, connections, counter = self._run(task)
+        lines, nodes, connections = emit_ctx
+        _process_task(task, "pb", lines, nodes, connections, 0)
         assert len(nodes.includes) == 1
         assert any("extra_tasks" in line for line in lines)
 
-    def test_block_task(self):
+    def test_block_task(self, emit_ctx):
         task = {
             "name": "Error handling",
             "type": "block",
@@ -118,36 +141,27 @@ class TestProcessTask:
                 {"name": "Rescue step", "type": "task"}
             ]
         }
-        lines, nodes, connections, counter = self._run(task)
+        lines, nodes, connections = emit_ctx
+        _process_task(task, "pb", lines, nodes, connections, 0)
         assert any("Error handling" in line for line in lines)
         assert any("Try step" in line for line in lines)
         assert any("Rescue step" in line for line in lines)
         # Block-Node + 2 Kind-Tasks
         assert len(nodes.tasks) == 3
 
-    def test_task_with_notify(self):
-        task = {
-            "name": "Install pkg",
-            "type": "task",
-            "notify": ["Restart service"]
-        }
-        lines, nodes, connections, counter = self._run(task)
-        assert any("notifies" in c for c in connections)
-        handler_id = sanitize("handler_Restart service")
-        assert handler_id in nodes.handlers
-
-    def test_task_with_multiple_notifies(self):
+    def test_task_with_multiple_notifies(self, emit_ctx):
         task = {
             "name": "Configure",
             "type": "task",
             "notify": ["Restart nginx", "Reload config"]
         }
-        lines, nodes, connections, counter = self._run(task)
+        lines, nodes, connections = emit_ctx
+        _process_task(task, "pb", lines, nodes, connections, 0)
         notify_connections = [c for c in connections if "notifies" in c]
         assert len(notify_connections) == 2
         assert len(nodes.handlers) == 2
 
-    def test_nested_block_with_role(self):
+    def test_nested_block_with_role(self, emit_ctx):
         task = {
             "name": "Deploy block",
             "type": "block",
@@ -155,64 +169,113 @@ class TestProcessTask:
                 {"name": "Apply role", "type": "role", "role_name": "webapp"}
             ]
         }
-        lines, nodes, connections, counter = self._run(task)
+        lines, nodes, connections = emit_ctx
+        _process_task(task, "pb", lines, nodes, connections, 0)
         assert sanitize("role_webapp") in nodes.roles
         assert any("==>" in c for c in connections)
 
-    def test_counter_increments(self):
-        task = {"name": "Task", "type": "task"}
-        _, _, _, counter = self._run(task)
-        assert counter == 1
+    def test_include_counter(self, emit_ctx):
+        task = {
+            "name": "Include",
+            "type": "include",
+            "include_file": "extra.yml",
+            "included_tasks": [{"name": "A", "type": "task"}, {"name": "B", "type": "task"}]
+        }
+        lines, nodes, connections = emit_ctx
+        counter = _process_task(task, "pb", lines, nodes, connections, 0)
+        # +1 vor jedem Kind, +1 pro Kind, +1 beim Verlassen
+        assert counter == 5
+        assert nodes.tasks == {"include_extra_yml_task_1", "include_extra_yml_task_3"}
+
+    def test_shared_include_expanded_once(self, emit_ctx):
+        shared = [{"name": "Shared step", "type": "task"}]
+        task = {
+            "name": "Outer",
+            "type": "block",
+            "block_tasks": [
+                {"name": "First", "type": "include", "include_file": "common.yml",
+                 "included_tasks": shared},
+                {"name": "Second", "type": "include", "include_file": "common.yml",
+                 "included_tasks": shared},
+            ]
+        }
+        lines, nodes, connections = emit_ctx
+        _process_task(task, "pb", lines, nodes, connections, 0)
+        assert sum("Shared step" in line for line in lines) == 1
+        assert sum(line.endswith("--> include_common_yml") for line in lines) == 2
 
-    def test_role_task_without_role_name(self):
-        task = {"name": "Unnamed role", "type": "role"}
-        lines, nodes, connections, counter = self._run(task)
-        assert counter == 1
-        assert len(connections) == 0
+    def test_cyclic_include_edge(self, emit_ctx):
+        task = {
+            "name": "Start",
+            "type": "include",
+            "include_file": "loop.yml",
+            "included_tasks": [
+                {"name": "Again", "type": "include", "include_file": "loop.yml",
+                 "included_tasks": [], "cyclic": True}
+            ]
+        }
+        lines, nodes, connections = emit_ctx
+        _process_task(task, "pb", lines, nodes, connections, 0)
+        assert any('include_loop_yml -.->|"cycle"| include_loop_yml' in line for line in lines)
+        assert nodes.includes == {"include_loop_yml"}
+
+    def test_deeply_nested_blocks(self, emit_ctx):
+        task = {"name": "Leaf", "type": "task"}
+        for i in range(3000):
+            task = {"name": f"Block {i}", "type": "block", "block_tasks": [task]}
+        lines, nodes, connections = emit_ctx
+        counter = _process_task(task, "pb", lines, nodes, connections, 0)
+        assert counter == 3001
+        assert len(nodes.tasks) == 3001
         assert len(nodes.roles) == 0
 
-    def test_task_with_when(self):
+    def test_task_with_when(self, emit_ctx):
         task = {"name": "Conditional", "type": "task", "when": ["ansible_os == 'Debian'"]}
-        lines, nodes, connections, counter = self._run(task)
+        lines, nodes, connections = emit_ctx
+        _process_task(task, "pb", lines, nodes, connections, 0)
         label_line = [line for line in lines if "Conditional" in line][0]
         assert "fa:fa-question" in label_line
         assert "when:" in label_line
 
-    def test_task_with_tags(self):
+    def test_task_with_tags(self, emit_ctx):
         task = {"name": "Tagged", "type": "task", "tags": ["deploy", "web"]}
-        lines, nodes, connections, counter = self._run(task)
+        lines, nodes, connections = emit_ctx
+        _process_task(task, "pb", lines, nodes, connections, 0)
         joined = "\n".join(lines)
         assert "fa:fa-tags deploy, web" in joined
         assert len(nodes.tags) == 1
         assert any("-.-" in line for line in lines)
 
-    def test_task_with_become(self):
+    def test_task_with_become(self, emit_ctx):
         task = {"name": "Privileged", "type": "task", "become": True}
-        lines, nodes, connections, counter = self._run(task)
+        lines, nodes, connections = emit_ctx
+        _process_task(task, "pb", lines, nodes, connections, 0)
         joined = "\n".join(lines)
         assert "fa:fa-key root" in joined
         assert len(nodes.becomes) == 1
         assert any("-.-" in line for line in lines)
 
-    def test_task_with_become_user(self):
+    def test_task_with_become_user(self, emit_ctx):
         task = {"name": "As postgres", "type": "task", "become": True, "become_user": "postgres"}
-        lines, nodes, connections, counter = self._run(task)
+        lines, nodes, connections = emit_ctx
+        _process_task(task, "pb", lines, nodes, connections, 0)
         joined = "\n".join(lines)
         assert "fa:fa-key postgres" in joined
         assert len(nodes.becomes) == 1
 
-    def test_block_with_when(self):
+    def test_block_with_when(self, emit_ctx):
         task = {
             "name": "Conditional block",
             "type": "block",
             "when": ["install_nginx"],
             "block_tasks": [{"name": "Step", "type": "task"}]
         }
-        lines, nodes, connections, counter = self._run(task)
+        lines, nodes, connections = emit_ctx
+        _process_task(task, "pb", lines, nodes, connections, 0)
         block_line = [line for line in lines if "Conditional block" in line][0]
         assert "fa:fa-question" in block_line
 
-    def test_block_with_tags_and_become(self):
+    def test_block_with_tags_and_become(self, emit_ctx):
         task = {
             "name": "Full block",
             "type": "block",
@@ -221,14 +284,15 @@ class TestProcessTask:
             "become_user": "deploy",
             "block_tasks": [{"name": "Step", "type": "task"}]
         }
-        lines, nodes, connections, counter = self._run(task)
+        lines, nodes, connections = emit_ctx
+        _process_task(task, "pb", lines, nodes, connections, 0)
         joined = "\n".join(lines)
         assert "fa:fa-tags setup" in joined
         assert "fa:fa-key deploy" in joined
         assert len(nodes.tags) == 1
         assert len(nodes.becomes) == 1
 
-    def test_task_all_attributes(self):
+    def test_task_all_attributes(self, emit_ctx):
         task = {
             "name": "Full task",
             "type": "task",
@@ -237,7 +301,8 @@ class TestProcessTask:
             "become": True,
             "become_user": "root"
         }
-        lines, nodes, connections, counter = self._run(task)
+        lines, nodes, connections = emit_ctx
+        _process_task(task, "pb", lines, nodes, connections, 0)
         label_line = [line for line in lines if "Full task" in line][0]
         assert "fa:fa-question" in label_line
         joined = "\n".join(lines)
@@ -346,6 +411,18 @@ class TestAddBecomeNode:
         assert lines == []
 
 
+# ============================================================
+# DiagramNodes.add
+# ============================================================
+
+class TestDiagramNodesAdd:
+    def test_returns_true_only_for_new_ids(self):
+        nodes = DiagramNodes()
+        assert nodes.add("handlers", "handler_restart") is True
+        assert nodes.add("handlers", "handler_restart") is False
+        assert nodes.handlers == {"handler_restart"}
+
+
 # ============================================================
 # _apply_classes
 # ============================================================
@@ -356,9 +433,9 @@ class TestApplyClasses:
         nodes = DiagramNodes(
             groups={"g1"},
             hosts={"h1"},
-            playbooks=["pb1"],
+            playbooks={"pb1"},
             roles={"r1"},
-            tasks=["t1"],
+            tasks={"t1"},
             handlers={"hd1"},
             includes={"i1"},
             tags={"tag1"},
@@ -376,6 +453,23 @@ class TestApplyClasses:
         assert "tagClass" in text
         assert "becomeClass" in text
 
+    def test_same_playbook_name_classed_once(self):
+        lines = []
+        nodes = DiagramNodes()
+        nodes.playbooks.add("site_yml")
+        nodes.playbooks.add("site_yml")
+        _apply_classes(lines, nodes)
+        assert lines == ["    class site_yml playbookClass"]
+
+    def test_large_sets_chunked(self):
+        lines = []
+        nodes = DiagramNodes(tasks={f"t{i}" for i in range(600)})
+        _apply_classes(lines, nodes)
+        assert len(lines) == 3
+        assert all(line.endswith(" taskClass") for line in lines)
+        ids = [i for line in lines for i in line.split()[1].split(",")]
+        assert ids == sorted(nodes.tasks)
+
     def test_empty_nodes(self):
         lines = []
         nodes = DiagramNodes()
@@ -424,6 +518,12 @@ class TestGenerateDiagram:
         assert 'subgraph playbooks_section["Playbooks"]' in diagram
         assert 'subgraph roles_section["Roles"]' in diagram
 
+    def test_iter_diagram_matches_generate(self):
+        data = self._minimal_data()
+        lines = iter_diagram(data, "TB")
+        assert next(lines) == "graph TB"
+        assert "\n".join(["graph TB", *lines]) == generate_diagram(data, "TB")
+
     def test_layout_parameter(self):
         data = self._minimal_data()
         for layout in ["TD", "LR", "BT", "RL"]:
@@ -457,6 +557,14 @@ class TestGenerateDiagram:
         diagram = generate_diagram(data)
         assert '"uses"' in diagram
 
+    def test_duplicate_connections_emitted_once(self):
+        data = self._minimal_data()
+        play = data.playbooks["/tmp/deploy.yml"]["plays"][0]
+        data.playbooks["/tmp/deploy.yml"]["plays"].append(dict(play))
+        diagram = generate_diagram(data)
+        assert diagram.count('deploy_yml ==>|"uses"| role_nginx') == 1
+        assert diagram.count('webservers -->|"runs"| deploy_yml') == 1
+
     def test_styles_present(self):
         data = self._minimal_data()
         diagram = generate_diagram(data)
@@ -533,6 +641,26 @@ class TestGenerateDiagram:
         assert "webservers" in diagram
         assert "databases" in diagram
 
+    def test_shared_include_expanded_once_across_tasks(self):
+        data = self._minimal_data()
+        shared = [{"name": "Shared step", "type": "task"}]
+        data.playbooks["/tmp/deploy.yml"]["plays"][0]["tasks"] = [
+            {"name": f"Include {i}", "type": "include", "include_file": "common.yml",
+             "included_tasks": shared}
+            for i in range(2)
+        ]
+        diagram = generate_diagram(data)
+        assert diagram.count("Shared step") == 1
+        assert diagram.count("deploy_yml --> include_common_yml") == 2
+
+    def test_host_in_several_groups_declared_once(self):
+        data = self._minimal_data()
+        data.groups = {"webservers": ["web1"], "production": ["web1"]}
+        diagram = generate_diagram(data)
+        assert diagram.count("fa:fa-server web1") == 1
+        assert "webservers --- web1" in diagram
+        assert "production --- web1" in diagram
+
     def test_play_become_in_diagram(self):
         data = self._minimal_data()
         data.playbooks["/tmp/deploy.yml"]["plays"][0]["become"] = True
@@ -589,3 +717,79 @@ class TestGenerateDiagram:
         diagram = generate_diagram(data)
         assert "class " in diagram
         assert "groupClass" in diagram
+
+
+# ============================================================
+# generate_diagram_cached
+# ============================================================
+
+class TestGenerateDiagramCached:
+    @pytest.fixture(autouse=True)
+    def _empty_cache(self):
+        mermaid_generator._diagram_cache.clear()
+        yield
+        mermaid_generator._diagram_cache.clear()
+
+    def _data(self):
+        data = AnsibleData()
+        data.groups = {"webservers": ["web1"]}
+        data.roles = {"nginx", "common"}
+        data.role_dependencies = {"nginx": ["common"]}
+        data.playbooks = {
+            "/tmp/site.yml": {
+                "name": "site.yml",
+                "plays": [{"hosts": "webservers", "roles": ["nginx"], "tasks": [], "handlers": []}],
+            }
+        }
+        return data
+
+    def test_matches_generate_diagram(self):
+        data = self._data()
+        assert generate_diagram_cached(data, "TB") == generate_diagram(data, "TB")
+
+    def test_unchanged_data_not_regenerated(self, monkeypatch):
+        calls = []
+        original = mermaid_generator.generate_diagram
+        monkeypatch.setattr(
+            mermaid_generator, "generate_diagram",
+            lambda *args: calls.append(args) or original(*args),
+        )
+        first = generate_diagram_cached(self._data())
+        # Gleicher Inhalt in einem neuen Objekt trifft denselben Eintrag
+        assert generate_diagram_cached(self._data()) is first
+        assert len(calls) == 1
+
+    def test_layout_and_content_change_key(self):
+        data = self._data()
+        lr = generate_diagram_cached(data, "LR")
+        assert generate_diagram_cached(data, "TD").startswith("graph TD")
+        data.groups["webservers"].append("web2")
+        changed = generate_diagram_cached(data, "LR")
+        assert changed != lr
+        assert "web2" in changed
+
+    def test_cache_evicts_least_recently_used(self, monkeypatch):
+        monkeypatch.setattr(mermaid_generator, "_DIAGRAM_CACHE_SIZE", 2)
+        generate_diagram_cached(self._data(), "TD")
+        generate_diagram_cached(self._data(), "LR")
+        # Treffer auf TD macht LR zum ältesten Eintrag
+        generate_diagram_cached(self._data(), "TD")
+        generate_diagram_cached(self._data(), "BT")
+        assert [key[0] for key in mermaid_generator._diagram_cache] == ["TD", "BT"]
+
+    def test_mixed_yaml_keys_do_not_fail(self):
+        data = self._data()
+        data.role_tasks = {"nginx": [
+            {"name": "Open ports", "vars": {"ports": {80: "http", "https": 443}}}
+        ]}
+        data.playbooks["/tmp/site.yml"]["plays"][0]["tasks"] = [
+            {"name": "Check", "type": "task", "when": [{1: "a", "b": 2}]}
+        ]
+        assert generate_diagram_cached(data) == generate_diagram(data)
+
+    def test_role_task_name_change_invalidates(self):
+        data = self._data()
+        data.role_tasks = {"nginx": [{"name": "Install nginx"}]}
+        generate_diagram_cached(data)
+        data.role_tasks["nginx"][0]["name"] = "Install nginx-full"
+        assert "Install nginx-full" in generate_diagram_cached(data)